@@ -1,28 +1,40 @@
 import sys
 from time import strftime, localtime, sleep
-from os import path, remove, makedirs, getcwd
-from datetime import datetime, timedelta
+from threading import Event
+from multiprocessing import freeze_support
+from os import path, makedirs, getcwd
+from shutil import rmtree
+from tempfile import mkdtemp
+from typing import TYPE_CHECKING
 import logging
 
-from PyQt5 import QtWidgets, QtGui
-from selenium import webdriver
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException, NoSuchWindowException, SessionNotCreatedException, WebDriverException
-from pandas import DataFrame
-from bokeh.models import ColumnDataSource, OpenURL, TapTool, WheelZoomTool, LinearColorMapper, \
-    BasicTicker, PrintfTickFormatter, ColorBar, HoverTool, FactorRange
-from bokeh.plotting import figure, output_file, show
-from bokeh.models.widgets import Panel, Tabs, DataTable, TableColumn, NumberFormatter
-from bokeh.transform import dodge
+from PyQt5 import QtWidgets, QtGui, QtCore
 
 import form
+import profiling
+from driverpool import DriverPool, PoolTimeout
+from fight_lines import only_known
+from page_cache import PageCache, page_head
+
+# selenium, pandas (store, parsing, loader, fetcher) and bokeh (report) are imported where they are used:
+# the window shows up without them, most runs never need selenium
+if TYPE_CHECKING:
+    from pandas import DataFrame
+    from parsing import FightBuffer
 
 # --------------------- CONFIG ---------------------
+# http fetcher, selenium is used as fallback
+USE_HTTP_FETCHER = True
+# fetch only fights newer than the ones saved in the fight store
+INCREMENTAL = True
+# keep fetched battle pages on disk (page_cache.py)
+PAGE_CACHE = True
 # selenium settings
 CAPABILITIES = {'Chrome': {'browserName': 'chrome', 'version': 'latest', 'javascriptEnabled': True},
                 'Firefox': {"alwaysMatch": {'browserName': 'Firefox', 'browserVersion': 'latest'}, 'javascriptEnabled': True}}
 IMPLICITLY_WAIT = 10
+# browsers of the session pool (driverpool.py) run without a window
+HEADLESS = True
 PATH_TO_WEBDRIVER = {'Chrome': 'chromedriver.exe',
                      'Firefox': 'geckodriver.exe'}
 # because fastcup raise "HTTP 429 Too Many Requests" :\
@@ -34,6 +46,8 @@ DAY_TO_STR = {1: 'Monday', 2: 'Tuesday', 3: 'Wednesday', 4: 'Thursday', 5: 'Frid
 STYLES_FILE = 'fcstats.qss'
 FONT = 'Segoe UI'
 LOG_DIRECTORY = 'log'
+# open the report in the browser when it is written
+OPEN_REPORT = True
 
 # --------------------------------------------------
 
@@ -48,23 +62,58 @@ def read_file(filename: str) -> str:
         return f.read()
 
 
-# for logs
-log_file_name = "log_%s.txt" % strftime("%Y-%m-%d", localtime())
-make_dir(LOG_DIRECTORY)
 logger = logging.getLogger("log")
-logger.setLevel(logging.DEBUG)
-# create the logging file handler
-fh = logging.FileHandler(path.join(LOG_DIRECTORY, log_file_name))
-formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-fh.setFormatter(formatter)
-# add handler to logger object
-logger.addHandler(fh)
+
+
+def setup_logging():
+    """log/log_<date>.txt, called by main so importing the module has no side effects"""
+    log_file_name = "log_%s.txt" % strftime("%Y-%m-%d", localtime())
+    make_dir(LOG_DIRECTORY)
+    logger.setLevel(logging.DEBUG)
+    # create the logging file handler
+    fh = logging.FileHandler(path.join(LOG_DIRECTORY, log_file_name))
+    formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
+    fh.setFormatter(formatter)
+    # add handler to logger object
+    logger.addHandler(fh)
+
+
+class Cancelled(Exception):
+    """The user stopped the worker"""
+    pass
+
+
+class Worker(QtCore.QThread):
+    """Runs func(*args) off the main thread, so the window keeps responding"""
+    failed = QtCore.pyqtSignal(bool)
+
+    def __init__(self, parent, func, *args):
+        super().__init__(parent)
+        self.func = func
+        self.args = args
+
+    def run(self):
+        # stages of the run are written next to the log
+        with profiling.run(self.func.__name__, LOG_DIRECTORY):
+            try:
+                self.func(*self.args)
+            except Cancelled:
+                logger.info('Cancelled')
+                self.failed.emit(True)
+            except Exception as e:
+                logger.error(str(e))
+                self.failed.emit(False)
 
 
 # form.ui -> form.py: pyuic5 form.ui -o form.py
 # build one file: pyinstaller -F -w --clean FCStats.py
 # build one dir: pyinstaller -D -w  --clean --add-data "chromedriver.exe";"." --add-data "geckodriver.exe";"." --add-data "fcstats.qss";"." FCStats.py
 class ExampleApp(QtWidgets.QMainWindow, form.Ui_form_fcstats):
+    progress = QtCore.pyqtSignal(str)
+    message = QtCore.pyqtSignal(str, str)
+    save_requested = QtCore.pyqtSignal(str)
+    report_ready = QtCore.pyqtSignal(str)
+
     def __init__(self):
         # access to variables and methods form.py
         super().__init__()
@@ -82,32 +131,131 @@ class ExampleApp(QtWidgets.QMainWindow, form.Ui_form_fcstats):
 
         self.button_load_file.clicked.connect(self.load_data)
 
+        # the worker thread talks to the window by signals only
+        self.progress.connect(self.statusbar.showMessage)
+        self.message.connect(self.show_message)
+        self.save_requested.connect(self.save_data)
+        self.report_ready.connect(self.open_report)
+        self.create_stats_text = self.button_create_stats.text()
+        self.worker = None
+        self.fetcher = None
+        self.cancel_event = Event()
+
         self.driver = None
+        self.driver_pools = {}
+        self.page_cache = None
         self.browser = None
         self.save_stats = None
+        # reports that aren't saved, removed with the window
+        self.temp_directory = None
         screen_size = QtWidgets.QDesktopWidget().availableGeometry()
         self.height = int(screen_size.height() * 0.85)
         self.width = int(screen_size.width() * 0.95)
 
     def main_process(self):
-        logger.debug('Start collecting data')
-        # init messagebox
-        msg = QtWidgets.QMessageBox
-
+        """Button handler: starts the collection in a worker thread, the second click stops it"""
+        if self.stop_worker():
+            return
+        # read the form here, widgets belong to the main thread
         save_in_file = self.checkbox_save_in_file.isChecked()
         self.save_stats = self.checkbox_save_stats.isChecked()
         self.browser = self.combox_browsers.currentText()
         player_name = self.line_edit.text()
-        if not path.exists(PATH_TO_WEBDRIVER[self.browser]):
-            mess = f"WebDriver не найден! Для {self.browser} он должен называться {PATH_TO_WEBDRIVER[self.browser]} и лежать в корне вместе с исполняемым файлом!"
-            logger.error(mess)
-            msg.about(self, "Ошибка!", mess)
-            return
         if not player_name:
+            msg = QtWidgets.QMessageBox
             msg.about(self, "Внимание!", "<p align='left'>Введите ник игрока!</p>")
             return
-        if not self.init_web_driver():
+        self.start_worker(self.collect_report, player_name, save_in_file)
+
+    def collect_report(self, player_name: str, save_in_file: bool):
+        """Collection, parsing and report of a player, runs in the worker thread"""
+        from fetcher import FetchError, FetchCancelled, PlayerNotFoundError
+        from parsing import FightBuffer
+        from store import FightStore
+        logger.debug('Start collecting data')
+        with FightStore() as store:
+            newest = store.newest_fight_id(player_name) if INCREMENTAL else None
+        buffer = None
+        # text of the pages for the save dialog, kept only when it is asked for
+        texts = [] if save_in_file else None
+        if USE_HTTP_FETCHER:
+            try:
+                # pages are parsed while the next ones are fetched
+                buffer = self.parse_pages(FightBuffer(), self.http_collection(player_name, newest), texts)
+            except PlayerNotFoundError:
+                mess = f"Пользователь с ником {player_name} не найден!"
+                logger.info(mess)
+                self.message.emit("Внимание!", mess)
+                return
+            except ValueError:
+                logger.info("Нет данных")
+                self.message.emit("Внимание!", "Нет данных!")
+                return
+            except FetchCancelled:
+                raise Cancelled()
+            except FetchError as e:
+                logger.warning(f'{e} in http collection, fallback to {self.browser}')
+                texts = [] if save_in_file else None
+        if buffer is None:
+            data = self.selenium_collection(player_name, newest)
+            if data is None:
+                return
+            buffer = self.parse_pages(FightBuffer(), data, texts)
+        if save_in_file:
+            self.save_requested.emit("\n".join(texts))
+        self.check_cancelled()
+        df = buffer.frame()
+        self.progress.emit(f'Боёв: {len(df)}')
+        with FightStore() as store, profiling.stage('store'):
+            store.insert(player_name, df)
+            stats = None
+            if INCREMENTAL:
+                df = store.load([player_name])
+                stats = store.load_cube([player_name])
+        self.visualization(df, player_name, stats)
+
+    @staticmethod
+    def parse_pages(buffer: 'FightBuffer', pages, texts: list = None) -> 'FightBuffer':
+        for page in pages:
+            buffer.append(page)
+            if texts is not None:
+                texts.append("\n".join(page))
+        return buffer
+
+    def http_collection(self, player_name: str, newest: int = None):
+        """Pages of the player as they arrive"""
+        from fetcher import HttpFetcher
+        fetcher = self.fetcher = HttpFetcher(progress=self.page_progress,
+                                             cache=self.get_page_cache() if PAGE_CACHE else None)
+        try:
+            if self.cancel_event.is_set():
+                fetcher.cancel()
+            yield from fetcher.iter_pages(fetcher.find_player(player_name), newest)
+        finally:
+            self.fetcher = None
+            fetcher.close()
+
+    def page_progress(self, fetched: int, pages: int):
+        self.progress.emit(f'Страниц: {fetched} из {pages}' if pages else f'Страниц: {fetched}')
+
+    def selenium_collection(self, player_name: str, newest: int = None):
+        from selenium.common.exceptions import SessionNotCreatedException
+        if not path.exists(PATH_TO_WEBDRIVER[self.browser]):
+            mess = f"WebDriver не найден! Для {self.browser} он должен называться {PATH_TO_WEBDRIVER[self.browser]} и лежать в корне вместе с исполняемым файлом!"
+            logger.error(mess)
+            self.message.emit("Ошибка!", mess)
             return
+        try:
+            with self.driver_pool().session(expected=(Cancelled,)) as self.driver:
+                return self.selenium_search(player_name, newest)
+        except (SessionNotCreatedException, PoolTimeout) as e:
+            logger.warning(f'{type(e).__name__} in browser session, {self.browser}')
+        finally:
+            self.driver = None
+
+    def selenium_search(self, player_name: str, newest: int = None):
+        from selenium.webdriver.common.by import By
+        from selenium.common.exceptions import NoSuchElementException, NoSuchWindowException, WebDriverException
         # open the page
         self.driver.get(PLAYERS)
         try:
@@ -115,10 +263,9 @@ class ExampleApp(QtWidgets.QMainWindow, form.Ui_form_fcstats):
             player = self.driver.find_element(By.XPATH, "//div[@class='right_col_textbox']/div[@class='msg']/a[contains(text(), '%s')]" % player_name)
             player.click()
         except NoSuchElementException:
-            self.driver.close()
             mess2 = f"Пользователь с ником {player_name} не найден!"
             logger.info(mess2)
-            msg.about(self, "Внимание!", mess2)
+            self.message.emit("Внимание!", mess2)
         except NoSuchWindowException:
             logger.warning(f'NoSuchWindowException in search player, {self.browser}')
         except WebDriverException:
@@ -127,21 +274,17 @@ class ExampleApp(QtWidgets.QMainWindow, form.Ui_form_fcstats):
             logger.warning(f'%s in search player, {self.browser}' % e)
         except Exception as e:
             logger.error(str(e))
-            msg.about(self, "Ошибка!", 'Что-то пошло не так...')
+            self.message.emit("Ошибка!", 'Что-то пошло не так...')
         else:
             try:
                 number_of_pages = int(self._get_element_list("//div[@id='mtabs-battles']")[0].split()[-1])
                 logger.info(f'Player: {player_name}, number of pages: {number_of_pages}, browser: {self.browser}')
-                data = self.data_collection(number_of_pages)
-                self.driver.close()
-                data = ["\n".join(page) for page in data]
-                data = "\n".join(data)
-                if save_in_file:
-                    self.save_data(data)
+                return self.data_collection(number_of_pages, newest)
+            except Cancelled:
+                raise
             except ValueError:
-                self.driver.close()
                 logger.info("Нет данных")
-                msg.about(self, "Внимание!", "Нет данных!")
+                self.message.emit("Внимание!", "Нет данных!")
             except AttributeError as e:
                 logger.warning(f'%s in collection, {self.browser}' % e)
             except NoSuchWindowException:
@@ -150,171 +293,187 @@ class ExampleApp(QtWidgets.QMainWindow, form.Ui_form_fcstats):
                 logger.warning(f'WebDriverException in collection, {self.browser}')
             except Exception as e:
                 logger.error(str(e))
-                msg.about(self, "Ошибка!", 'Что-то пошло не так...')
-            else:
-                try:
-                    self.visualization(data, player_name)
-                except Exception as e:
-                    logger.error(str(e))
-                    msg.about(self, "Ошибка!", 'Что-то пошло не так...')
+                self.message.emit("Ошибка!", 'Что-то пошло не так...')
 
     def load_data(self):
-        try:
-            logger.debug('Load from file')
-            self.save_stats = self.checkbox_save_stats.isChecked()
-            directory = QtWidgets.QFileDialog.getOpenFileNames(self, "Загрузка файлов", filter="*.txt")
-            path_to_files = directory[0]
-            if path_to_files:
-                data = []
-                for path_to_file in path_to_files:
-                    with open(path_to_file, 'r', encoding='utf-8') as f:
-                        data.append(f.read())
-                file_name = path_to_files[0].split('/')[-1][:-4] if len(path_to_files) == 1 else 'Union'
-                self.visualization('\n'.join(data), file_name)
-        except Exception as e:
-            logger.error(str(e))
-            msg = QtWidgets.QMessageBox
-            msg.about(self, "Ошибка!", 'Что-то пошло не так...')
-
-    def visualization(self, data, player_name):
-        logger.debug('Start visualuzation')
-        prepared_data = self.data_preparation(data)
-        df = self.create_dataframe(prepared_data)
-        df_wins_defeats = df[(df.Результат == "Победа") | (df.Результат == "Поражение")]
-        series_date = [str(date).split()[0] for date in df_wins_defeats.Дата.sort_values()]
-        tabs = []
-
-        player_name = self.replace_unsupported_chars(player_name)
-        file_name = f"Fights_{player_name}.html"
-        output_file(file_name, title='FCStats')
-
-        tabs.append(Panel(child=self.build_graph_skill_fights(df_wins_defeats), title='Skill-Fights'))
-
-        p = self.build_hist(df_wins_defeats, 'Карта', 'Map', label_orientation=True)
-        if p:
-            tabs.append(Panel(child=p, title='Skill-Maps'))
-
-        p = self.build_hist(df_wins_defeats, 'Размер', 'Size')
-        if p:
-            tabs.append(Panel(child=p, title='Skill-Sizes'))
-
-        p = self.build_hist(df_wins_defeats, 'Сторона', 'Side')
-        if p:
-            tabs.append(Panel(child=p, title='Skill-Sides'))
-
-        p = self.build_hist(df_wins_defeats, series_date, 'Date', visible_xaxis=False, visible_grid=False)
-        if p:
-            tabs.append(Panel(child=p, title='Skill-Dates'))
-
-        p = self.build_hist(df_wins_defeats, 'Год', 'Year')
-        if p:
-            tabs.append(Panel(child=p, title='Skill-Years'))
-
-        p = self.build_hist(df_wins_defeats, 'Месяц', 'Month')
-        if p:
-            tabs.append(Panel(child=p, title='Skill-Months'))
-
-        p = self.build_hist(df_wins_defeats, 'ДеньНедели', 'DayOfWeek')
-        if p:
-            tabs.append(Panel(child=p, title='Skill-DaysOfWeek'))
-
-        p = self.build_hist(df_wins_defeats, 'Час', 'Hour', visible_grid=False)
-        if p:
-            tabs.append(Panel(child=p, title='Skill-Hours'))
+        if self.worker is not None:
+            return
+        logger.debug('Load from file')
+        self.save_stats = self.checkbox_save_stats.isChecked()
+        directory = QtWidgets.QFileDialog.getOpenFileNames(self, "Загрузка файлов", filter="*.txt *.sqlite")
+        path_to_files = directory[0]
+        if path_to_files:
+            self.start_worker(self.load_report, path_to_files)
+
+    def load_report(self, path_to_files: [str]):
+        """Report of saved files, runs in the worker thread"""
+        from loader import SOURCE, load_files, report_name
+        from roster import roster_cube
+        df, stats = load_files(path_to_files)
+        self.progress.emit(f'Боёв: {len(df)}')
+        self.check_cancelled()
+        # a Union or a store of several players compares them with each other, overlapping files of one player
+        # are one player (loader.same_players)
+        roster = roster_cube(df, SOURCE) if df[SOURCE].nunique() > 1 else None
+        self.visualization(df, report_name(path_to_files), stats, roster)
+
+    def start_worker(self, func, *args):
+        self.cancel_event.clear()
+        self.worker = Worker(self, func, *args)
+        self.worker.failed.connect(self.worker_failed)
+        self.worker.finished.connect(self.worker_finished)
+        self.worker.finished.connect(self.worker.deleteLater)
+        self.button_create_stats.setText("Остановить")
+        self.button_load_file.setEnabled(False)
+        self.worker.start()
+
+    def stop_worker(self) -> bool:
+        """Ask the running worker to stop, False if there is none"""
+        if self.worker is None:
+            return False
+        logger.info('Cancel')
+        self.cancel_event.set()
+        if self.fetcher is not None:
+            self.fetcher.cancel()
+        self.statusbar.showMessage('Остановка...')
+        return True
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise Cancelled()
+
+    def worker_failed(self, cancelled: bool):
+        if cancelled:
+            self.statusbar.showMessage('Остановлено')
+        else:
+            self.show_message("Ошибка!", 'Что-то пошло не так...')
 
-        p = self.build_categorical_hist(df_wins_defeats, ['Карта', 'Сторона'], 'Map-Side', label_orientation=True)
-        if p:
-            tabs.append(Panel(child=p, title='Skill-Maps'))
+    def worker_finished(self):
+        self.worker = None
+        self.button_create_stats.setText(self.create_stats_text)
+        self.button_load_file.setEnabled(True)
 
-        p = self.heat_map(df_wins_defeats, ['Год', 'Месяц'])
-        if p:
-            tabs.append(Panel(child=p, title='Years-Month'))
+    def show_message(self, title: str, text: str):
+        msg = QtWidgets.QMessageBox
+        msg.about(self, title, text)
 
-        tabs.append(Panel(child=self.common_table(df), title='Common table'))
+    @staticmethod
+    def open_report(file_name: str):
+        QtGui.QDesktopServices.openUrl(QtCore.QUrl.fromLocalFile(path.abspath(file_name)))
+
+    def report_directory(self) -> str:
+        """Current directory for the saved reports, a temporary one for the others"""
+        if self.save_stats:
+            return '.'
+        if self.temp_directory is None:
+            self.temp_directory = mkdtemp(prefix='fcstats_')
+        return self.temp_directory
+
+    def closeEvent(self, event):
+        if self.stop_worker():
+            self.worker.wait()
+        for pool in self.driver_pools.values():
+            pool.close()
+        if self.temp_directory is not None:
+            rmtree(self.temp_directory, ignore_errors=True)
+        super().closeEvent(event)
+
+    def visualization(self, df: 'DataFrame', player_name, stats: 'DataFrame' = None, roster: 'DataFrame' = None):
+        from report import Report, timed, replace_unsupported_chars, write_report
+        logger.debug('Start visualuzation')
+        player_name = replace_unsupported_chars(player_name)
+        file_name = path.join(self.report_directory(), f"Fights_{player_name}.html")
 
-        tabs = Tabs(tabs=tabs)
-        show(tabs)
+        tabs = Report(self.width, self.height, self.progress.emit, self.check_cancelled).build(df, stats, roster)
+        size, render_time = timed(write_report, tabs, file_name)
+        logger.info(f'Render: {render_time:.3f} s, html: {size / 2 ** 20:.2f} MB')
         logger.debug('End visualuzation')
 
-        if not self.save_stats:
-            sleep(6)  # for load file
-            remove(file_name)
+        if OPEN_REPORT:
+            self.report_ready.emit(file_name)
 
-    def data_collection(self, number_of_pages: int) -> list:
+    def data_collection(self, number_of_pages: int, newest: int = None) -> list:
+        from selenium.webdriver.common.by import By
         logger.debug('Data collection')
+        first = self._get_element_list("//div[@id='mtabs-battles']")
+        data = self.cached_pages(first, number_of_pages, newest)
+        if data is not None:
+            return data
+        player, head = self.driver.current_url.split('?')[0], page_head(first)
         data = []
         for i in range(2, number_of_pages + 1):
-            data.append(self._get_element_list("//div[@id='mtabs-battles']")[2:])
+            with profiling.stage('page'):
+                lines = self._get_element_list("//div[@id='mtabs-battles']")
+            profiling.count('pages_fetched')
+            if PAGE_CACHE:
+                self.get_page_cache().put(player, i - 1, lines, head)
+            data.append(lines[2:])
+            self.page_progress(len(data), number_of_pages)
+            self.check_cancelled()
+            # the rest of the pages are already in the store
+            if newest is not None and only_known(data[-1], newest):
+                return data
             # click next page
-            self.driver.find_element(By.XPATH, "//div[@id='mtabs-battles']/a[contains(text(), '%d')]" % i).click()
+            with profiling.stage('page_click'):
+                self.driver.find_element(By.XPATH, "//div[@id='mtabs-battles']/a[contains(text(), '%d')]" % i).click()
             # because fastcup raise "HTTP 429 Too Many Requests" :\
             sleep(SLEEP_ON_PAGE[self.browser])
-        data.append(self._get_element_list("//div[@id='mtabs-battles']")[2:])
+        with profiling.stage('page'):
+            lines = self._get_element_list("//div[@id='mtabs-battles']")
+        profiling.count('pages_fetched')
+        if PAGE_CACHE:
+            self.get_page_cache().put(player, number_of_pages, lines, head)
+        data.append(lines[2:])
         return data
 
-    def init_web_driver(self, wait=IMPLICITLY_WAIT) -> bool:
-        try:
-            logger.debug('Init web driver')
-            self.driver = webdriver.Chrome(executable_path=PATH_TO_WEBDRIVER[self.browser],
-                                           desired_capabilities=CAPABILITIES[self.browser])
-            self.driver.implicitly_wait(wait)
-            return True
-        except SessionNotCreatedException:
-            logging.warning('SessionNotCreatedException in init_web_driver()')
-            return False
+    def cached_pages(self, first: [str], number_of_pages: int, newest: int = None):
+        """Pages of the player from the page cache when all of them are there, the browser stays on the first page"""
+        head = page_head(first)
+        if not PAGE_CACHE or head is None:
+            return None
+        cache = self.get_page_cache()
+        cache.reset_stats()
+        player = self.driver.current_url.split('?')[0]
+        data = [first[2:]]
+        for page in range(2, number_of_pages + 1):
+            if newest is not None and only_known(data[-1], newest):
+                break
+            lines = cache.get(player, page, head)
+            if lines is None:
+                cache.log_stats()
+                return None
+            data.append(lines[2:])
+        cache.log_stats()
+        return data
+
+    def get_page_cache(self) -> PageCache:
+        if self.page_cache is None:
+            self.page_cache = PageCache()
+        return self.page_cache
 
-    def data_preparation(self, data: str) -> [list]:
-        """
-        Don't try to understand it, just believe"""
-        logger.debug('Data preparation')
-        dt = []
-        for line in data.split("\n"):
-            if not line:
-                continue
-            ln = line.split()
-            x = ln.index("CS")
-            fight = ln[0]
-            date, time = self.__get_date_time(ln[1:x])
-            year, month, day = date.split('-')
-            hour, minutes = time.split(':')
-            type_game = " ".join(ln[x:x+3])
-            xvsx = "".join(ln[x+4:x+7])
-            mp = ln[x+7]
-            side, result, k, d, sep = "", "", "", "", ""
-            points = 0.0
-            exp = 0
-            side = "T" if ln[x+8] == "A" else "CT"
-            if ln[x+9] == "Не":
-                result = " ".join(ln[x+9:x+11])
-            elif ln[x+9] == "Ошибка":
-                result = ln[x+9]
-            else:
-                result = ln[x+9]
-                try:
-                    k, d = map(int, ln[x+10].split('/'))
-                except ValueError:
-                    k, d = 0, 0
-                try:
-                    points = float(ln[x+11])
-                except IndexError:
-                    points = 0.0
-                try:
-                    if ln[x+12][0] == "(":
-                        sep = ln[x+12]
-                        exp = ln[x+13]
-                    else:
-                        sep = ""
-                        try:
-                            exp = ln[x+12]
-                        except IndexError:
-                            pass
-                except IndexError:
-                    pass
-            dt.append([fight, date, time, year, month, day, hour, minutes, type_game,
-                      xvsx, mp, side, result, k, d, points, sep, exp])
-        return dt
+    def driver_pool(self) -> DriverPool:
+        """Warm sessions of the chosen browser"""
+        browser = self.browser
+        if browser not in self.driver_pools:
+            self.driver_pools[browser] = DriverPool(lambda: self.init_web_driver(browser))
+        return self.driver_pools[browser]
+
+    @staticmethod
+    def init_web_driver(browser: str, wait=IMPLICITLY_WAIT):
+        from selenium import webdriver
+        logger.debug('Init web driver')
+        with profiling.stage('init_web_driver'):
+            options = webdriver.ChromeOptions()
+            if HEADLESS:
+                options.add_argument('--headless')
+            driver = webdriver.Chrome(executable_path=PATH_TO_WEBDRIVER[browser],
+                                      desired_capabilities=CAPABILITIES[browser], options=options)
+            driver.implicitly_wait(wait)
+        return driver
 
     def search_player(self, player_name: str):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.common.keys import Keys
         logger.debug('Search player')
         element = self.driver.find_element(By.XPATH, "//input[@placeholder='Ник или STEAM_0:X:XXXXXX']")
         element.send_keys(player_name)
@@ -327,353 +486,13 @@ class ExampleApp(QtWidgets.QMainWindow, form.Ui_form_fcstats):
             with open(directory[0], "w", encoding='utf-8') as f:
                 f.write(data)
 
-    def build_graph_skill_fights(self, df: DataFrame):
-        logger.debug('Graph skill-fights')
-        y = df.Скилл
-        x = range(1, len(y) + 1)
-        fights = list(map(lambda x_: x_[1:], df.Игра))
-        difference_kd = [k-d for k, d in zip(df.Фраги, df.Смерти)]
-
-        source = ColumnDataSource(data=dict(
-            x=x,
-            y=y,
-            fights=fights,
-            kills=df.Фраги,
-            deaths=df.Смерти,
-            map=df.Карта,
-            size=df.Размер,
-            difference_kd=difference_kd
-        ))
-
-        colors = ['#E60C00', '#E67E00', '#FFCC0F', '#B5EB00', '#78EB00', '#2BEB00']
-        color_mapper = LinearColorMapper(palette=colors,
-                                         low=min(difference_kd), high=max(difference_kd))
-
-        TOOLTIPS = [
-            ('K/D', "@kills/@deaths"),
-            ('Skill', '@y{0.0}'),
-            ('Map', '@map'),
-            ('xVSx', '@size')
-        ]
-        hover_tools = HoverTool(tooltips=TOOLTIPS, line_policy='nearest', point_policy='snap_to_data')
-
-        # sizing_mode='stretch_both' don't work in tabs :(
-        p = figure(title="Click on fights!", x_axis_label='Fight number', y_axis_label='Skill',
-                   tools="pan,tap,wheel_zoom,reset", active_drag="pan", width=self.width, height=self.height)
-
-        p.circle('x', 'y', size=8, nonselection_fill_alpha=0.7, fill_alpha=0.7, source=source,
-                 legend="Fights", color={'field': 'difference_kd', 'transform': color_mapper},
-                 nonselection_color={'field': 'difference_kd', 'transform': color_mapper})
-        p.toolbar.active_scroll = p.select_one(WheelZoomTool)
-        p.tools.append(hover_tools)
-
-        color_bar = ColorBar(color_mapper=color_mapper, major_label_text_font_size="8pt",
-                             ticker=BasicTicker(desired_num_ticks=len(colors)),
-                             formatter=PrintfTickFormatter(format='%d k/d difference'),
-                             label_standoff=21, border_line_color=None, location=(0, 0))
-        p.add_layout(color_bar, 'right')
-
-        url = 'https://fastcup.net/fight.html?id=@fights'
-        taptool = p.select(type=TapTool)
-        taptool.callback = OpenURL(url=url)
-        return p
-
-    def build_hist(self, df: DataFrame, group_by_col, name: str, visible_xaxis=True, visible_grid=True, label_orientation=False):
-        logger.debug(f'Build hist {name}')
-        # prepare data
-        df_group = df.groupby(group_by_col).Скилл
-        if len(df_group.sum()) <= 1:
-            return False
-        wins_defeats_count = df.groupby(group_by_col).Результат.value_counts()
-
-        x = list(df_group.sum().index)
-        number_of_fights = df_group.count().values
-        skill_sum = df_group.sum().values
-        kills_sum = df.groupby(group_by_col).Фраги.sum()
-        deaths_sum = df.groupby(group_by_col).Смерти.sum()
-        wins_count = [wins_defeats_count[i].get('Победа', 0) for i in x]
-        defeats_count = [wins_defeats_count[i].get('Поражение', 0) for i in x]
-
-        source = ColumnDataSource(data=dict(
-            x=x,
-            y=skill_sum,
-            number_of_fights=number_of_fights,
-            avg_skill=list(map(lambda x, y: x/y, skill_sum, number_of_fights)),
-            kills=kills_sum,
-            deaths=deaths_sum,
-            wins=wins_count,
-            defeats=defeats_count
-        ))
-
-        colors = ['#deebf7', '#c6dbef', '#9ecae1', '#6baed6', '#4292c6', '#2171b5', '#084594']
-        color_mapper = LinearColorMapper(palette=colors,
-                                         low=min(number_of_fights), high=max(number_of_fights))
-
-        TOOLTIPS = [
-            ('Skill', '@y{0.0}'),
-            ('Average skill', '@avg_skill{0.000}'),
-            ('Number of fights', '@number_of_fights'),
-            (name, '@x'),
-            ('K/D', '@kills/@deaths'),
-            ('Wins', '@wins'),
-            ('Defeats', '@defeats')
-        ]
-
-        # sizing_mode='stretch_both' don't work in tabs :(
-        p = figure(x_range=x, title="", tooltips=TOOLTIPS, tools="pan,wheel_zoom,reset", width=self.width, height=self.height,
-                   y_axis_label='Skill')
-        p.vbar(x='x', top='y', width=0.9, source=source, color={'field': 'number_of_fights', 'transform': color_mapper})
-        p.toolbar.active_scroll = p.select_one(WheelZoomTool)
-
-        min_skill_sum = min(skill_sum)
-        p.y_range.start = min_skill_sum if min_skill_sum < 0 else 0
-        if label_orientation:
-            p.xaxis.major_label_orientation = 3.14 / 3
-
-        color_bar = ColorBar(color_mapper=color_mapper, major_label_text_font_size="8pt",
-                             ticker=BasicTicker(desired_num_ticks=len(colors)),
-                             formatter=PrintfTickFormatter(format='%d fights'),
-                             label_standoff=13, border_line_color=None, location=(0, 0))
-        p.add_layout(color_bar, 'right')
-
-        if not visible_xaxis:
-            p.xaxis.major_label_text_font_size = '0pt'
-
-        if not visible_grid:
-            p.grid.grid_line_color = None
-            p.axis.major_tick_line_color = None
-
-        return p
-
-    def build_categorical_hist(self, df: DataFrame, group_by_col, name: str, visible_xaxis=True,
-                               visible_grid=True, label_orientation=False):
-        logger.debug('Categorical hist')
-        # prepare data
-        df_group = df.groupby(group_by_col)
-        if len(df_group.sum()) <= 1:
-            return False
-        wins_defeats_count = df.groupby(group_by_col).Результат.value_counts()
-        # sides_count = df.groupby(group_by_col).Сторона.value_counts()
-
-        x = list(df_group.sum().index)
-        number_of_fights = df_group.count().reset_index().Скилл.values
-        skill_sum = df_group.sum().reset_index().Скилл.values
-        kills_sum = df_group.Фраги.sum().reset_index().Фраги.values
-        deaths_sum = df_group.Смерти.sum().reset_index().Смерти.values
-        wins_count = [wins_defeats_count[i].get('Победа', 0) for i in x]
-        defeats_count = [wins_defeats_count[i].get('Поражение', 0) for i in x]
-
-        res_indx_count = df_group.count().reset_index()
-        x = [(mp, sd) for mp, sd in zip(res_indx_count.Карта, res_indx_count.Сторона)]
-
-        source = ColumnDataSource(data=dict(
-            x=x,
-            y=skill_sum,
-            avg_skill=list(map(lambda x, y: x/y, skill_sum, number_of_fights)),
-            number_of_fights=number_of_fights,
-            kills=kills_sum,
-            deaths=deaths_sum,
-            wins=wins_count,
-            defeats=defeats_count
-        ))
-
-        colors = ['#deebf7', '#c6dbef', '#9ecae1', '#6baed6', '#4292c6', '#2171b5', '#084594']
-        color_mapper = LinearColorMapper(palette=colors,
-                                         low=min(number_of_fights), high=max(number_of_fights))
-
-        TOOLTIPS = [
-            ('Skill', '@y{0.0}'),
-            ('Average skill', '@avg_skill{0.000}'),
-            ('Number of fights', '@number_of_fights'),
-            (name, '@x'),
-            ('K/D', '@kills/@deaths'),
-            ('Wins', '@wins'),
-            ('Defeats', '@defeats')
-        ]
-
-        # sizing_mode='stretch_both' don't work in tabs :(
-        p = figure(x_range=FactorRange(*x), title="", tooltips=TOOLTIPS, tools="pan,wheel_zoom,reset", width=self.width, height=self.height,
-                   y_axis_label='Skill')
-        p.vbar(x='x', top='y', width=0.9, source=source, color={'field': 'number_of_fights', 'transform': color_mapper})
-        p.toolbar.active_scroll = p.select_one(WheelZoomTool)
-
-        min_skill_sum = min(skill_sum)
-        p.y_range.start = min_skill_sum if min_skill_sum < 0 else 0
-        if label_orientation:
-            p.xaxis.group_label_orientation = 3.14 / 3
-
-        color_bar = ColorBar(color_mapper=color_mapper, major_label_text_font_size="8pt",
-                             ticker=BasicTicker(desired_num_ticks=len(colors)),
-                             formatter=PrintfTickFormatter(format='%d fights'),
-                             label_standoff=13, border_line_color=None, location=(0, 0))
-        p.add_layout(color_bar, 'right')
-
-        if not visible_xaxis:
-            p.xaxis.major_label_text_font_size = '0pt'
-
-        if not visible_grid:
-            p.grid.grid_line_color = None
-            p.axis.major_tick_line_color = None
-
-        return p
-
-    def heat_map(self, df: DataFrame, group_by_col):
-        logger.debug('Heat map')
-        df_group = df.groupby(group_by_col)
-        if len(df_group.sum()) <= 1:
-            return False
-        wins_defeats_count = df.groupby(group_by_col).Результат.value_counts()
-
-        months = df_group.sum().reset_index().Месяц.values
-        years = df_group.sum().reset_index().Год.values
-        x = list(df_group.sum().index)
-        number_of_fights = df_group.count().Игра.values
-        skill_sum = [round(i, 1) for i in df_group.Скилл.sum().values]
-        kills_sum = df.groupby(group_by_col).Фраги.sum().values
-        deaths_sum = df.groupby(group_by_col).Смерти.sum().values
-        wins_count = [wins_defeats_count[i].get('Победа', 0) for i in x]
-        defeats_count = [wins_defeats_count[i].get('Поражение', 0) for i in x]
-
-        source = ColumnDataSource(data=dict(
-            x=months,
-            y=years,
-            number_of_fights=number_of_fights,
-            avg_skill=list(map(lambda x, y: x/y, skill_sum, number_of_fights)),
-            kills=kills_sum,
-            deaths=deaths_sum,
-            wins=wins_count,
-            defeats=defeats_count,
-            skill_sum=skill_sum
-        ))
-
-        colors = ['#deebf7', '#c6dbef', '#9ecae1', '#6baed6', '#4292c6', '#2171b5', '#084594']
-        color_mapper = LinearColorMapper(palette=colors,
-                                         low=min(number_of_fights), high=max(number_of_fights))
-        colors_skill = ['#000000', '#FFFFFF']
-        color_mapper_skill = LinearColorMapper(palette=colors_skill,
-                                               low=min(number_of_fights), high=max(number_of_fights))
-        colors_wins = ['#002d00', '#00ea00']
-        color_mapper_wins = LinearColorMapper(palette=colors_wins,
-                                              low=min(number_of_fights), high=max(number_of_fights))
-        colors_defeats = ['#380000', '#e30000', '#ff2435']
-        color_mapper_defeats = LinearColorMapper(palette=colors_defeats,
-                                                 low=min(number_of_fights), high=max(number_of_fights))
-
-        TOOLTIPS = [
-            ('Skill', '@skill_sum{0.0}'),
-            ('Average skill', '@avg_skill{0.000}'),
-            ('Number of fights', '@number_of_fights'),
-            ('Year', '@y'),
-            ('Month', '@x'),
-            ('K/D', '@kills/@deaths'),
-            ('Wins', '@wins'),
-            ('Defeats', '@defeats')
-        ]
-        hover_tools = HoverTool(tooltips=TOOLTIPS, line_policy='nearest', point_policy='snap_to_data', names=['rect'])
-
-        p = figure(title="",
-                   x_range=['01', '02', '03', '04', '05', '06',
-                            '07', '08', '09', '10', '11', '12'],
-                   y_range=sorted(set(df.Год)),
-                   x_axis_location="above", plot_width=self.width, plot_height=self.height,
-                   tools="pan,box_zoom,reset,wheel_zoom")
-
-        p.rect(x="x", y="y", width=1, height=1,
-               source=source,
-               fill_color={'field': 'number_of_fights', 'transform': color_mapper},
-               line_color='#deebf7',
-               name='rect')
-        p.tools.append(hover_tools)
-
-        text_props = {"source": source, "text_font_size": '8pt', "x_offset": -0.8}
-
-        x = dodge("x", -0.4, range=p.x_range)
-        p.text(x=x, y=dodge("y", 0.2, range=p.y_range), text="skill_sum",
-               text_color={'field': 'number_of_fights', 'transform': color_mapper_skill}, **text_props)
-        p.text(x=x, y=dodge("y", -0.1, range=p.y_range), text="wins",
-               text_color={'field': 'number_of_fights', 'transform': color_mapper_wins}, **text_props)
-        p.text(x=x, y=dodge("y", -0.25, range=p.y_range), text="defeats",
-               text_color={'field': 'number_of_fights', 'transform': color_mapper_defeats}, **text_props)
-
-        p.grid.grid_line_color = None
-        p.axis.axis_line_color = None
-        p.axis.major_tick_line_color = None
-        p.axis.major_label_text_font_size = "8pt"
-        p.axis.major_label_standoff = 0
-        # p.xaxis.major_label_orientation = pi / 3
-
-        color_bar = ColorBar(color_mapper=color_mapper, major_label_text_font_size="8pt",
-                             ticker=BasicTicker(desired_num_ticks=len(colors)),
-                             formatter=PrintfTickFormatter(format='%d fights'),
-                             label_standoff=13, border_line_color=None, location=(0, 0))
-        p.add_layout(color_bar, 'right')
-
-        return p
-
     def _get_element_list(self, xpath: str):
+        from selenium.webdriver.common.by import By
         return self.driver.find_element(By.XPATH, xpath).text.split('\n')
 
-    @staticmethod
-    def common_table(df: DataFrame):
-        logger.debug('Common table')
-        ddf = df.Игра.groupby(df.Результат).count().to_frame()
-
-        source = ColumnDataSource(data=dict(
-            y=ddf.index.values,
-            fights_count=ddf.values,
-            skill_sum=df.Скилл.groupby(df.Результат).sum().values
-        ))
-        columns = [
-            TableColumn(field="y", title="Результат"),
-            TableColumn(field="fights_count", title="Количество"),
-            TableColumn(field="skill_sum", title="Суммарный скилл", formatter=NumberFormatter(format="0.0"))
-        ]
-
-        data_table = DataTable(source=source, columns=columns, width=800)
-
-        return data_table
-
-    @staticmethod
-    def create_dataframe(dt: [list]) -> DataFrame:
-        labels = ["Игра", "Дата", "Время", "Год", "Месяц", "День", "Час", "Минуты", "Канал", "Размер", "Карта",
-                  "Сторона", "Результат", "Фраги", "Смерти", "Скилл", "Деление", "Опыт"]
-        df = DataFrame.from_records(dt, columns=labels).iloc[::-1]
-        df['Дата'] = df.Дата.astype('datetime64[ns]')
-        df['ДеньНедели'] = [str(date.isoweekday()) for date in df.Дата]
-        df = df.sort_values('Дата')
-        return df
-
-    @staticmethod
-    def __get_date_time(lst_dt: [str]) -> (str, str):
-        month_to_num = dict(января='01', февраля='02', марта='03', апреля='04', мая='05', июня='06',
-                            июля='07', августа='08', сентября='09', октября='10', ноября='11', декабря='12')
-        days_to_int = dict(Сегодня=0, Вчера=1, Позавчера=2)
-
-        now = datetime.today()
-        if len(lst_dt) == 4:
-            if lst_dt[2] == 'назад':
-                date = now.strftime("%Y-%m-%d")
-                time = now.strftime("%H:%M")
-                if 'мин' in lst_dt[1]:
-                    time = (now - timedelta(minutes=int(lst_dt[0]))).strftime("%H:%M")
-            else:
-                time = lst_dt[3]
-                lst_dt[0] = lst_dt[0].zfill(2)
-                lst_dt[1] = month_to_num[lst_dt[1]]
-                date = '-'.join(lst_dt[2::-1])
-        else:
-            time = lst_dt[1]
-            date = (now - timedelta(days=days_to_int[lst_dt[0]])).strftime("%Y-%m-%d")
-        return date, time
-
-    @staticmethod
-    def replace_unsupported_chars(string: str) -> str:
-        for i in r'/\:*?«<>|"':
-            string = string.replace(i, '_')
-        return string
-
 
 def main():
+    setup_logging()
     try:
         logger.debug('Start program')
         app = QtWidgets.QApplication(sys.argv)
@@ -686,4 +505,6 @@ def main():
 
 
 if __name__ == '__main__':
+    # the Union loader (loader.py) starts processes, the one-file build needs this to run them
+    freeze_support()
     main()
@@ -0,0 +1,61 @@
+import logging
+
+import numpy as np
+from pandas import DataFrame, Series
+
+from schema import INTEGERS
+
+logger = logging.getLogger("log")
+
+WIN = "Победа"
+DEFEAT = "Поражение"
+# columns of aggregate, in the order of the chart tooltips
+STATS = ['skill', 'fights', 'kills', 'deaths', 'wins', 'defeats']
+# finest grain of the charts: every chart of FCStats.visualization is a sum over the cube of these keys
+GRAIN = ['Дата', 'Час', 'Карта', 'Сторона', 'Размер', 'Результат']
+
+
+def _keys(df: DataFrame, keys) -> [Series]:
+    """A column, a list of columns or values aligned with df (like the dates of the fights) -> series to group by.
+    A list may mix columns and series"""
+    if isinstance(keys, str):
+        return [df[keys]]
+    if isinstance(keys, list):
+        return [df[key] if isinstance(key, str) else key for key in keys]
+    return [Series(np.asarray(keys), index=df.index)]
+
+
+def aggregate(df: DataFrame, keys) -> DataFrame:
+    """Skill sum, number of fights, kills, deaths, wins and defeats of every key in one groupby pass.
+    keys are a column, a list of columns or a series/array aligned with df,
+    the index of the result are the sorted keys"""
+    result = df.Результат
+    stats = DataFrame({
+        'skill': df.Скилл.astype(np.float64),
+        'fights': np.ones(len(df), dtype=np.int64),
+        'kills': df.Фраги.astype(np.int64),
+        'deaths': df.Смерти.astype(np.int64),
+        'wins': (result == WIN).astype(np.int64),
+        'defeats': (result == DEFEAT).astype(np.int64)
+    }, columns=STATS, index=df.index)
+    # observed=True keeps the categories in the order they are met, the charts show them sorted
+    return stats.groupby(_keys(df, keys), observed=True).sum().sort_index()
+
+
+def add_date_parts(cube: DataFrame) -> DataFrame:
+    """Год, Месяц, ДеньНедели of the days of the cube, to roll it up by them"""
+    date = cube.Дата.dt
+    cube['Год'] = date.year.astype(INTEGERS['Год'])
+    cube['Месяц'] = date.month.astype(INTEGERS['Месяц'])
+    cube['ДеньНедели'] = (date.dayofweek + 1).astype(INTEGERS['ДеньНедели'])
+    return cube
+
+
+def cube(df: DataFrame) -> DataFrame:
+    """Stats of the fights by GRAIN, one row per non-empty cell"""
+    return add_date_parts(aggregate(df, GRAIN).reset_index())
+
+
+def rollup(cube: DataFrame, keys) -> DataFrame:
+    """Same result as aggregate of the fights the cube was built from, keys are any of GRAIN and the date parts"""
+    return cube.groupby(_keys(cube, keys), observed=True)[STATS].sum().sort_index()
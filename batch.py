@@ -0,0 +1,200 @@
+"""Reports of many players without the window: nicknames are collected over http, saved files are loaded,
+every player gets Fights_<nick>.html in the output directory and a line in the timing summary
+
+    python batch.py nick1 nick2 Fights_nick3.txt --workers 4 --output reports
+    python batch.py --roster roster.txt --compare     # and Roster.html comparing the players
+"""
+import argparse
+import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os import path, makedirs
+from time import perf_counter
+
+from bokeh.models.widgets import Tabs
+
+from aggregation import cube
+from fetcher import FC_URL, HttpFetcher, PlayerNotFoundError
+from loader import load_files, report_name
+import profiling
+from page_cache import PageCache
+from parsing import FightBuffer
+from report import WIDTH, HEIGHT, RESOURCES, Report, report_resources, timed, replace_unsupported_chars, \
+    write_report
+from roster import join_cubes
+from store import STORE_DIRECTORY, STORE_FILE, FightStore
+
+# --------------------- CONFIG ---------------------
+# players processed at the same time, one process each
+WORKERS = 4
+OUTPUT_DIRECTORY = 'reports'
+SUMMARY_FILE = 'summary.txt'
+ROSTER_FILE = 'Roster.html'
+LOG_FORMAT = '%(asctime)s %(process)d %(levelname)s %(message)s'
+
+# --------------------------------------------------
+
+logger = logging.getLogger("log")
+
+STAGES = ['fetch', 'parse', 'store', 'report', 'save']
+
+
+def setup_logging(level=logging.INFO):
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+
+
+def read_roster(file_name: str) -> [str]:
+    """One nickname or saved file per line, # starts a comment"""
+    with open(file_name, 'r', encoding='utf-8') as f:
+        lines = (line.split('#', 1)[0].strip() for line in f)
+        return [line for line in lines if line]
+
+
+def collect(player_name: str, job: dict, row: dict):
+    """Fights of the player from the site and its rollup cube, new fights are added to the store"""
+    with FightStore(job['store']) as store:
+        newest = store.newest_fight_id(player_name) if job['incremental'] else None
+    cache = PageCache() if job['cache'] else None
+    fetcher = HttpFetcher(job['url'], cache=cache)
+    buffer = FightBuffer()
+
+    def fetch():
+        # pages are parsed while the next ones are fetched, so fetch includes most of the parsing
+        for page in fetcher.iter_pages(fetcher.find_player(player_name), newest):
+            buffer.append(page)
+    try:
+        _, row['fetch'] = timed(fetch)
+    finally:
+        fetcher.close()
+        if cache:
+            cache.close()
+    df, row['parse'] = timed(buffer.frame)
+
+    def store_fights():
+        with FightStore(job['store']) as store:
+            store.insert(player_name, df)
+            if job['incremental']:
+                return store.load([player_name]), store.load_cube([player_name])
+        return df, None
+    (df, stats), row['store'] = timed(store_fights)
+    return df, stats
+
+
+def player_report(job: dict) -> dict:
+    """Report of one nickname or saved file, the result is its row of the summary, errors included"""
+    source = job['source']
+    with profiling.run(report_name([source]), job['output'], job['profile'], job['trace_memory']):
+        return _player_report(job, source)
+
+
+def _player_report(job: dict, source: str) -> dict:
+    row = dict(player=source, fights=0, html=0.0, status='ok', **{stage: 0.0 for stage in STAGES})
+    try:
+        if path.isfile(source):
+            (df, stats), row['parse'] = timed(load_files, [source])
+            name = report_name([source])
+        else:
+            df, stats = collect(source, job, row)
+            name = source
+        row['fights'] = len(df)
+        if job.get('compare'):
+            # the cube of the player is sent back for the comparison, the fights stay in the worker
+            row['name'], row['stats'] = name, stats if stats is not None else cube(df)
+        tabs, row['report'] = timed(Report(job['width'], job['height']).build, df, stats)
+        file_name = path.join(job['output'], f"Fights_{replace_unsupported_chars(name)}.html")
+        size, row['save'] = timed(write_report, tabs, file_name, resources=job['resources'])
+        row['html'] = size / 2 ** 20
+    except PlayerNotFoundError:
+        row['status'] = 'not found'
+    except ValueError:
+        row['status'] = 'no data'
+    except Exception as e:
+        logger.error(f'{source}: {e}')
+        row['status'] = f'error: {e}'
+    row['total'] = sum(row[stage] for stage in STAGES)
+    logger.info(f'Player: {source}, fights: {row["fights"]}, {row["total"]:.2f} s, {row["status"]}')
+    return row
+
+
+def summary(rows: [dict], duration: float) -> str:
+    header = '%-24s %8s' % ('player', 'fights') + ''.join('%9s' % stage for stage in STAGES + ['total']) + \
+        '%9s  status' % 'html MB'
+    lines = [header]
+    for row in rows:
+        lines.append('%-24s %8d' % (row['player'][:24], row['fights']) +
+                     ''.join('%9.2f' % row[stage] for stage in STAGES + ['total']) +
+                     '%9.2f  ' % row['html'] + row['status'])
+    ok = sum(row['status'] == 'ok' for row in rows)
+    lines.append(f'Players: {len(rows)}, ok: {ok}, wall time: {duration:.2f} s')
+    return '\n'.join(lines)
+
+
+def run(sources: [str], output: str = OUTPUT_DIRECTORY, workers: int = WORKERS, **job) -> [dict]:
+    """Reports of all sources, workers processes at a time; rows of the summary in the order of sources"""
+    if not path.exists(output):
+        makedirs(output)
+    # BokehJS is copied before the workers write their reports
+    report_resources(output, job.get('resources', RESOURCES))
+    jobs = [dict(job, source=source, output=output) for source in sources]
+    start = perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(workers, initializer=setup_logging) as pool:
+            futures = {pool.submit(player_report, job): i for i, job in enumerate(jobs)}
+            rows = [None] * len(jobs)
+            for future in as_completed(futures):
+                rows[futures[future]] = future.result()
+    else:
+        rows = [player_report(job) for job in jobs]
+    if job.get('compare'):
+        compare(rows, output, job)
+    text = summary(rows, perf_counter() - start)
+    with open(path.join(output, SUMMARY_FILE), 'w', encoding='utf-8') as f:
+        f.write(text + '\n')
+    print(text)
+    return rows
+
+
+def compare(rows: [dict], output: str, job: dict):
+    """ROSTER_FILE of the players with a report: ranking and every player on the same charts"""
+    cubes = {row.pop('name'): row.pop('stats') for row in rows if 'stats' in row}
+    if len(cubes) < 2:
+        logger.warning('Roster: less than two players to compare')
+        return
+    start = perf_counter()
+    roster = join_cubes(cubes)
+    tabs = Tabs(tabs=Report(job['width'], job['height']).build_roster(roster))
+    size = write_report(tabs, path.join(output, ROSTER_FILE), 'FCStats Roster', job.get('resources', RESOURCES))
+    logger.info(f'Roster: {len(cubes)} players, {perf_counter() - start:.2f} s, html: {size / 2 ** 20:.2f} MB')
+
+
+def main():
+    args = argparse.ArgumentParser(description='FCStats reports of many players without the window')
+    args.add_argument('players', nargs='*', help='nicknames or saved files (.txt, .sqlite)')
+    args.add_argument('--roster', help='file with one nickname or saved file per line')
+    args.add_argument('--workers', type=int, default=WORKERS)
+    args.add_argument('--output', default=OUTPUT_DIRECTORY)
+    args.add_argument('--store', default=path.join(STORE_DIRECTORY, STORE_FILE))
+    args.add_argument('--full', action='store_true', help='fetch all the fights, not only the new ones')
+    args.add_argument('--no-cache', action='store_true', help="don't use the page cache")
+    args.add_argument('--url', default=FC_URL, help='site to fetch from, e.g. a fixture_server.py')
+    args.add_argument('--width', type=int, default=WIDTH)
+    args.add_argument('--height', type=int, default=HEIGHT)
+    args.add_argument('--profile', action='store_true', help='cProfile of every player, OUTPUT/run_*.prof')
+    args.add_argument('--trace-memory', action='store_true', help='peak memory and top allocations of every player')
+    args.add_argument('--compare', action='store_true', help=f'OUTPUT/{ROSTER_FILE} comparing the players')
+    args.add_argument('--resources', choices=['local', 'inline', 'cdn'], default=RESOURCES,
+                      help='BokehJS of the reports: copied to OUTPUT/static, inside every report or from the internet')
+    args = args.parse_args()
+    sources = args.players + (read_roster(args.roster) if args.roster else [])
+    if not sources:
+        sys.exit('No players')
+    setup_logging()
+    rows = run(sources, args.output, args.workers, store=args.store, incremental=not args.full,
+               cache=not args.no_cache, url=args.url,
+               width=args.width, height=args.height, resources=args.resources,
+               profile=args.profile, trace_memory=args.trace_memory, compare=args.compare)
+    sys.exit(0 if all(row['status'] == 'ok' for row in rows) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+"""Benchmarks on synthetic histories
+
+    python benchmark.py parse --fights 1000 10000 100000
+    python benchmark.py stream --fights 100000
+    python benchmark.py render --fights 10000 100000
+    python benchmark.py form --fights 10000 100000
+    python benchmark.py suite --results results.json --compare results_before.json
+    python benchmark.py startup
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+from os import path
+from time import perf_counter
+
+import bokeh
+import numpy as np
+import pandas
+
+from bokeh.embed import file_html
+from bokeh.models import TapTool
+from bokeh.resources import CDN
+from pandas.testing import assert_frame_equal
+
+import parsing
+import report
+import trends
+from aggregation import WIN, DEFEAT, cube, rollup
+from fight_lines import fight_id
+from schema import apply_schema, memory_usage
+from synthetic import generate_lines, generate_text
+
+# --------------------- CONFIG ---------------------
+FIGHTS = [1000, 10000, 100000]
+REPEAT = 3
+PAGE_SIZE = 20
+NOW = datetime(2019, 3, 1, 12, 0)
+RESULTS_FILE = 'benchmark_results.json'
+# a stage this many times slower or bigger than in the compared results is a regression
+REGRESSION = 1.2
+# stages faster than this are timer noise, only their memory is compared
+MIN_SECONDS = 0.05
+
+# --------------------------------------------------
+
+
+def best_time(func, repeat: int = REPEAT):
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        result = func()
+        times.append(perf_counter() - start)
+    return min(times), result
+
+
+def bench_parse(fights: [int], repeat: int = REPEAT):
+    """Line-by-line data_preparation + create_dataframe against the vectorized parse_fights,
+    the outputs must be equal after schema.apply_schema"""
+    print('%10s %16s %16s %8s %18s' % ('fights', 'loop rows/s', 'vector rows/s', 'speedup', 'frame MB'))
+    for n in fights:
+        data = generate_text(n, seed=n, now=NOW)
+        loop, expected = best_time(lambda: parsing.create_dataframe(parsing.data_preparation(data, NOW)), repeat)
+        before = memory_usage(expected)
+        expected = apply_schema(expected)
+        vector, df = best_time(lambda: parsing.parse_fights(data, NOW), repeat)
+        assert_frame_equal(expected, df)
+        print('%10d %16.0f %16.0f %7.2fx %8.2f -> %6.2f' % (
+            n, n / loop, n / vector, loop / vector, before / 2 ** 20, memory_usage(df) / 2 ** 20))
+
+
+def simulated_pages(lines: [str]):
+    """Pages as the fetcher yields them, every page is new strings"""
+    for i in range(0, len(lines), PAGE_SIZE):
+        yield "\n".join(lines[i:i + PAGE_SIZE]).split("\n")
+
+
+def collect_then_parse(lines: [str]):
+    """All the pages, one text of them, then parse_fights; (frame, seconds after the last page)"""
+    data = list(simulated_pages(lines))
+    last_page = perf_counter()
+    df = parsing.parse_fights("\n".join("\n".join(page) for page in data), NOW)
+    return df, perf_counter() - last_page
+
+
+def stream_parse(lines: [str]):
+    """Pages parsed into a FightBuffer as they arrive; (frame, seconds after the last page)"""
+    buffer = parsing.FightBuffer(NOW)
+    for page in simulated_pages(lines):
+        buffer.append(page)
+    last_page = perf_counter()
+    df = buffer.frame()
+    return df, perf_counter() - last_page
+
+
+def peak_memory(func, *args) -> int:
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_stream(fights: [int], repeat: int = REPEAT):
+    """collect_then_parse against stream_parse: total time, time after the last page and peak memory"""
+    print('%10s %18s %18s %18s' % ('fights', 'total s', 'after last page s', 'peak MB'))
+    print('%10s %18s %18s %18s' % ('', 'batch / stream', 'batch / stream', 'batch / stream'))
+    for n in fights:
+        lines = generate_lines(n, seed=n, now=NOW)
+        batch, (expected, batch_tail) = best_time(lambda: collect_then_parse(lines), repeat)
+        stream, (df, stream_tail) = best_time(lambda: stream_parse(lines), repeat)
+        assert_frame_equal(expected, df)
+        batch_peak, stream_peak = peak_memory(collect_then_parse, lines), peak_memory(stream_parse, lines)
+        print('%10d %8.2f / %-7.2f %8.3f / %-7.3f %8.1f / %-7.1f' % (
+            n, batch, stream, batch_tail, stream_tail, batch_peak / 2 ** 20, stream_peak / 2 ** 20))
+
+
+def render_skill_fights(df, lod_points: int) -> (int, int):
+    """Skill-Fights of the fights with the given LOD threshold -> (points shown, html bytes)"""
+    threshold, report.LOD_POINTS = report.LOD_POINTS, lod_points
+    try:
+        p = report.Report().build_graph_skill_fights(df)
+    finally:
+        report.LOD_POINTS = threshold
+    points = len(p.select_one(TapTool).renderers[0].data_source.data['x'])
+    return points, len(file_html(p, CDN, 'FCStats').encode('utf-8'))
+
+
+def bench_render(fights: [int], repeat: int = REPEAT):
+    """Skill-Fights with every fight against the level of detail of report.LOD_POINTS: points, html size and
+    time to build the chart and write its html"""
+    print('%10s %20s %20s %18s' % ('fights', 'points', 'html MB', 'render s'))
+    print('%10s %20s %20s %18s' % ('', 'all / lod', 'all / lod', 'all / lod'))
+    for n in fights:
+        df = parsing.parse_fights(generate_text(n, seed=n, now=NOW), NOW)
+        full_time, (full_points, full_size) = best_time(lambda: render_skill_fights(df, n), repeat)
+        lod_time, (lod_points, lod_size) = best_time(lambda: render_skill_fights(df, report.LOD_POINTS), repeat)
+        print('%10d %9d / %-8d %9.2f / %-8.2f %8.2f / %-7.2f' % (
+            n, full_points, lod_points, full_size / 2 ** 20, lod_size / 2 ** 20, full_time, lod_time))
+
+
+def form_loop(df, window: int = trends.ROLLING_FIGHTS, map_window: int = trends.MAP_FIGHTS) -> np.ndarray:
+    """trends.form fight by fight, the reference of bench_form: skill, K/D, win rate, streak, map skill"""
+    skill, kills, deaths = df.Скилл.values, df.Фраги.values, df.Смерти.values
+    win, maps = df.Результат.values == WIN, df.Карта.values
+    rows, on_map, streak = [], {}, 0
+    for i in range(len(df)):
+        last = slice(max(0, i - window + 1), i + 1)
+        if i and win[i] == win[i - 1]:
+            streak += 1 if win[i] else -1
+        else:
+            streak = 1 if win[i] else -1
+        map_skill = on_map.setdefault(maps[i], [])
+        map_skill.append(skill[i])
+        rows.append((skill[last].mean(), kills[last].sum() / max(deaths[last].sum(), 1), win[last].mean(), streak,
+                     np.mean(map_skill[-map_window:])))
+    return np.array(rows)
+
+
+def bench_form(fights: [int], repeat: int = REPEAT):
+    """Fight-by-fight form_loop against the cumsum columns of trends.form, the outputs must be equal;
+    the time per fight of the vectorized form stays flat as the history grows"""
+    print('%10s %16s %16s %8s %16s' % ('fights', 'loop rows/s', 'vector rows/s', 'speedup', 'vector us/fight'))
+    for n in fights:
+        df = parsing.parse_fights(generate_text(n, seed=n, now=NOW), NOW)
+        df = df[(df.Результат == WIN) | (df.Результат == DEFEAT)]
+        # the reference takes the order played from the fight ids, not from the parse
+        played = df.iloc[np.argsort([fight_id(fight) for fight in df.Игра], kind='mergesort')]
+        loop, expected = best_time(lambda: form_loop(played), 1)
+        vector, result = best_time(lambda: trends.form(df), repeat)
+        assert np.allclose(expected, result[trends.FORM[1:]].values)
+        print('%10d %16.0f %16.0f %7.1fx %16.3f' % (
+            len(df), len(df) / loop, len(df) / vector, loop / vector, vector / len(df) * 1e6))
+
+
+def pipeline(data: str, directory: str) -> [tuple]:
+    """(stage, func) of parse -> aggregate -> build -> write, every func takes the result of the previous one,
+    the report is written to the directory"""
+    keys = ['Карта', 'Размер', 'Сторона', 'Год', 'Месяц', 'ДеньНедели', 'Час', ['Карта', 'Сторона'],
+            ['Год', 'Месяц'], 'Результат']
+
+    def aggregate(df):
+        stats = cube(df)
+        for key in keys:
+            rollup(stats, key)
+        return df, stats
+
+    return [
+        ('data_preparation', lambda _: parsing.create_dataframe(parsing.data_preparation(data, NOW))),
+        ('parse_fights', lambda _: parsing.parse_fights(data, NOW)),
+        ('aggregate', aggregate),
+        ('build', lambda frames: report.Report().build(*frames)),
+        ('write', lambda tabs: report.write_report(tabs, path.join(directory, 'Fights_bench.html'), resources='cdn'))
+    ]
+
+
+def bench_suite(fights: [int], repeat: int = REPEAT) -> dict:
+    """Time (best of repeat) and peak memory (tracemalloc, a separate run) of every stage of the pipeline"""
+    results = {}
+    print('%-18s %10s %10s %10s' % ('stage', 'fights', 'seconds', 'peak MB'))
+    for n in fights:
+        data = generate_text(n, seed=n, now=NOW)
+        result = None
+        with tempfile.TemporaryDirectory() as directory:
+            for stage, func in pipeline(data, directory):
+                seconds, output = best_time(lambda: func(result), repeat)
+                peak = peak_memory(func, result)
+                if stage != 'data_preparation':
+                    result = output
+                results.setdefault(stage, {})[str(n)] = dict(seconds=round(seconds, 4),
+                                                             peak_mb=round(peak / 2 ** 20, 2))
+                print('%-18s %10d %10.3f %10.1f' % (stage, n, seconds, peak / 2 ** 20))
+        results['write'][str(n)]['html_mb'] = round(result / 2 ** 20, 2)
+    return results
+
+
+def save_results(results: dict, file_name: str):
+    data = dict(date=datetime.now().isoformat(timespec='seconds'), python=platform.python_version(),
+                pandas=pandas.__version__, bokeh=bokeh.__version__, machine=platform.machine(), stages=results)
+    with open(file_name, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def compare(results: dict, file_name: str) -> [str]:
+    """Stages and sizes more than REGRESSION times slower or bigger than in the results file"""
+    with open(file_name, 'r', encoding='utf-8') as f:
+        before = json.load(f)['stages']
+    regressions = []
+    print('%-18s %10s %20s %20s' % ('stage', 'fights', 'seconds', 'peak MB'))
+    for stage, sizes in results.items():
+        for n, now in sizes.items():
+            old = before.get(stage, {}).get(n)
+            if old is None:
+                continue
+            ratios = {key: now[key] / old[key] for key in ('seconds', 'peak_mb') if old[key]}
+            if max(old['seconds'], now['seconds']) < MIN_SECONDS:
+                ratios.pop('seconds', None)
+            print('%-18s %10s %9.3f -> %-8.3f %9.1f -> %-8.1f %s' % (
+                stage, n, old['seconds'], now['seconds'], old['peak_mb'], now['peak_mb'],
+                ' '.join(f'{key} x{ratio:.2f}' for key, ratio in ratios.items() if ratio > REGRESSION)))
+            regressions += [f'{stage} {n}: {key} x{ratio:.2f}' for key, ratio in ratios.items() if ratio > REGRESSION]
+    return regressions
+
+
+# a new interpreter until the window is shown, like a start of FCStats.exe
+STARTUP_SCRIPT = """
+import sys
+from PyQt5 import QtWidgets
+import FCStats
+app = QtWidgets.QApplication(sys.argv)
+window = FCStats.ExampleApp()
+window.show()
+app.processEvents()
+print(' '.join(module for module in ('pandas', 'bokeh', 'selenium', 'requests') if module in sys.modules))
+"""
+
+
+def bench_startup(repeat: int = REPEAT):
+    """Time to window of the desktop app and the heavy modules loaded by then"""
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        loaded = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=path.dirname(path.abspath(__file__)),
+                                stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout.strip()
+        times.append(perf_counter() - start)
+    print('time to window: best %.3f s, mean %.3f s of %d starts' % (min(times), sum(times) / len(times), repeat))
+    print('loaded at start: ' + (loaded or '-'))
+
+
+def main():
+    args = argparse.ArgumentParser(description='FCStats benchmarks on synthetic histories')
+    args.add_argument('stage', choices=['parse', 'stream', 'render', 'form', 'suite', 'startup'])
+    args.add_argument('--fights', type=int, nargs='+', default=FIGHTS)
+    args.add_argument('--repeat', type=int, default=REPEAT)
+    args.add_argument('--results', default=RESULTS_FILE, help='suite: file the results are written to')
+    args.add_argument('--compare', help='suite: earlier results, the exit code is 1 on a regression')
+    args = args.parse_args()
+    if args.stage == 'parse':
+        bench_parse(args.fights, args.repeat)
+    elif args.stage == 'stream':
+        bench_stream(args.fights, args.repeat)
+    elif args.stage == 'render':
+        bench_render(args.fights, args.repeat)
+    elif args.stage == 'form':
+        bench_form(args.fights, args.repeat)
+    elif args.stage == 'suite':
+        results = bench_suite(args.fights, args.repeat)
+        save_results(results, args.results)
+        regressions = compare(results, args.compare) if args.compare else []
+        if regressions:
+            sys.exit('Regressions: ' + ', '.join(regressions))
+    elif args.stage == 'startup':
+        bench_startup(args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""Live report on a bokeh server: the charts are built once, then the fights that appear on the site are
+streamed into Skill-Fights and patched into the histograms, only the sums of the new fights are computed
+
+    python dashboard.py nick --url http://127.0.0.1:8000      # a fixture_server.py or the site
+    python dashboard.py --demo                                # local feed that plays a few fights every poll
+"""
+import argparse
+import logging
+import random
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from time import sleep
+
+import numpy as np
+from pandas import DataFrame, concat
+from bokeh.application import Application
+from bokeh.application.handlers.function import FunctionHandler
+from bokeh.document import without_document_lock
+from bokeh.models import GlyphRenderer, HoverTool, LinearColorMapper, TapTool
+from bokeh.models.widgets import Panel, Tabs
+from bokeh.server.server import Server
+from tornado import gen
+
+from aggregation import WIN, DEFEAT, aggregate, cube, rollup
+from fetcher import FC_URL, HttpFetcher
+from fight_lines import fight_id
+from fixture_server import FixtureServer
+from parsing import FightBuffer
+from report import WIDTH, HEIGHT, LOD_POINTS, Report, factor_codes, names_formatter
+from synthetic import generate_lines, new_fight_lines
+
+# --------------------- CONFIG ---------------------
+PORT = 5006
+# seconds between the polls of the first pages of the player
+POLL_SECONDS = 10
+# fights on Skill-Fights, the oldest ones roll over. Above report.LOD_POINTS the report shows buckets instead
+LIVE_POINTS = LOD_POINTS
+# --demo: fights of the history and the most fights played between two polls
+DEMO_NICK = 'demo'
+DEMO_FIGHTS = 2000
+DEMO_NEW_FIGHTS = 3
+
+# --------------------------------------------------
+
+logger = logging.getLogger("log")
+
+# (title, key of the rollup, arguments of Report.build_hist), Дата is rolled up by day
+LIVE_CHARTS = [
+    ('Skill-Maps', 'Карта', dict(name='Map', label_orientation=True)),
+    ('Skill-Sizes', 'Размер', dict(name='Size')),
+    ('Skill-Sides', 'Сторона', dict(name='Side')),
+    ('Skill-Dates', 'Дата', dict(name='Date', visible_xaxis=False, visible_grid=False)),
+    ('Skill-Years', 'Год', dict(name='Year')),
+    ('Skill-Months', 'Месяц', dict(name='Month')),
+    ('Skill-DaysOfWeek', 'ДеньНедели', dict(name='DayOfWeek')),
+    ('Skill-Hours', 'Час', dict(name='Hour', visible_grid=False))
+]
+
+
+def rollup_keys(df: DataFrame, key: str):
+    """Key of a live chart for the fights or the cube, days are the '2019-03-01' of the report"""
+    return df.Дата.dt.strftime('%Y-%m-%d').values if key == 'Дата' else key
+
+
+def wins_defeats(df: DataFrame) -> DataFrame:
+    return df[(df.Результат == WIN) | (df.Результат == DEFEAT)]
+
+
+def widen(source, **columns):
+    """Numbers of the source (and the columns replaced) as float64: BokehJS streams and patches into
+    the typed array of a column, so a packed int8 column would overflow with the new values"""
+    data = dict(source.data, **columns)
+    # in place: data = ... is ignored when the values are equal
+    source.data.update({name: column.astype(np.float64) for name, column in data.items()
+                        if isinstance(column, np.ndarray) and column.dtype.kind in 'iubf'})
+
+
+def as_lists(data: dict) -> dict:
+    """Columns of stream and patch: python lists of the widened types"""
+    return {name: np.asarray(column, dtype=np.float64).tolist()
+            if isinstance(column, np.ndarray) and column.dtype.kind in 'iubf' else list(column)
+            for name, column in data.items()}
+
+
+class LiveFights:
+    """Fights of a player on the site: the first poll fetches the whole history, the next ones only the pages
+    down to the newest fight already seen and return the fights after it"""
+    def __init__(self, player_name: str, url: str = FC_URL):
+        # no page cache: the first page must be live
+        self.fetcher = HttpFetcher(url)
+        self.player_url = self.fetcher.find_player(player_name)
+        self.newest = None
+
+    def close(self):
+        self.fetcher.close()
+
+    def poll(self) -> DataFrame:
+        buffer = FightBuffer()
+        newest = self.newest
+        for page in self.fetcher.iter_pages(self.player_url, newest):
+            if newest is not None:
+                page = [line for line in page if fight_id(line) > newest]
+            if page:
+                self.newest = max(self.newest or 0, max(fight_id(line) for line in page))
+                buffer.append(page)
+        return buffer.frame()
+
+
+class LiveRollup:
+    """Bars of a live chart (or rows of the common table) and the sums behind them, in the order of the source.
+    update adds the sums of the new fights: known bars are patched, new ones are streamed"""
+    def __init__(self, source, stats: DataFrame, columns, x_range=None, color_mapper=None, y_range=None):
+        self.source = source
+        self.stats = self.by_factors(stats)
+        # sums -> columns of the source
+        self.columns = columns
+        self.x_range = x_range
+        self.color_mapper = color_mapper
+        self.y_range = y_range
+        widen(self.source)
+
+    def update(self, delta: DataFrame) -> (int, int):
+        """delta: aggregation.aggregate of the new fights by the key of the chart; (patched, streamed) bars"""
+        delta = self.by_factors(delta)
+        known = delta.index.isin(self.stats.index)
+        changed, new = delta.index[known], delta[~known]
+        if len(changed):
+            self.stats.loc[changed] += delta.loc[changed]
+            positions = [int(i) for i in self.stats.index.get_indexer(changed)]
+            columns = as_lists(self.columns(self.stats.loc[changed]))
+            self.source.patch({name: list(zip(positions, values)) for name, values in columns.items()})
+        if len(new):
+            self.stats = concat([self.stats, new])
+            self.source.stream(as_lists(self.columns(new)))
+            if self.x_range is not None:
+                # the bars are placed by the factors, they stay sorted like in the report
+                self.x_range.factors = sorted(self.stats.index)
+        if self.color_mapper is not None:
+            self.color_mapper.update(low=self.stats.fights.min(), high=self.stats.fights.max())
+        if self.y_range is not None:
+            self.y_range.start = min(0, self.stats.skill.min())
+        return len(changed), len(new)
+
+    @staticmethod
+    def by_factors(stats: DataFrame) -> DataFrame:
+        """Sums indexed by the factors of the chart"""
+        stats = stats.copy()
+        stats.index = Report.factors(stats.index)
+        return stats
+
+
+class LiveReport:
+    """Tabs of the dashboard built from the history, update() adds the new fights to them"""
+    def __init__(self, df: DataFrame, width=WIDTH, height=HEIGHT, live_points=LIVE_POINTS):
+        report = Report(width, height)
+        self.live_points = live_points
+        fights = wins_defeats(df)
+        self.fights = len(fights)
+        tail = fights.iloc[-live_points:]
+        p = report.build_graph_skill_fights(tail)
+        tabs = [Panel(child=p, title='Skill-Fights')]
+        self.source = p.select_one(TapTool).renderers[0].data_source
+        widen(self.source, x=np.arange(self.fights - len(tail) + 1, self.fights + 1))
+        self.color_mapper = p.select_one(LinearColorMapper)
+        self.formatters = p.select_one(HoverTool).formatters
+        self.names = {column: factor_codes(tail[column])[1] for column in ('Карта', 'Размер')}
+
+        stats = cube(df)
+        stats_wins_defeats = wins_defeats(stats)
+        self.rollups = []
+        for title, key, kwargs in LIVE_CHARTS:
+            chart_stats = rollup(stats_wins_defeats, rollup_keys(stats_wins_defeats, key))
+            p = report.build_hist(chart_stats, **kwargs)
+            if not p:
+                # a single bar has no chart in the report, it would have to be built when the second one comes
+                continue
+            self.rollups.append((key, LiveRollup(
+                p.select_one({'type': GlyphRenderer}).data_source, chart_stats,
+                lambda s: Report.stats_columns(s, x=list(s.index), y=s.skill.values),
+                p.x_range, p.select_one(LinearColorMapper), p.y_range)))
+            tabs.append(Panel(child=p, title=title))
+        results = rollup(stats, 'Результат')
+        table = report.common_table(results)
+        self.table = LiveRollup(table.source, results, Report.table_columns)
+        tabs.append(Panel(child=table, title='Common table'))
+        self.tabs = Tabs(tabs=tabs)
+
+    def codes(self, column: str, values) -> [int]:
+        """Codes of the hover formatter of the column, new names are added to it"""
+        names = self.names[column]
+        new = [name for name in dict.fromkeys(map(str, values)) if name not in names]
+        if new:
+            names.extend(new)
+            self.formatters['map' if column == 'Карта' else 'size'].code = names_formatter(names).code
+        index = {name: i for i, name in enumerate(names)}
+        return [index[str(value)] for value in values]
+
+    def update(self, df: DataFrame):
+        """New fights of LiveFights.poll, in the order they were played"""
+        if not len(df):
+            return
+        fights = wins_defeats(df)
+        if len(fights):
+            x = np.arange(self.fights + 1, self.fights + len(fights) + 1)
+            self.fights += len(fights)
+            columns = Report.fights_columns(fights, x, self.codes('Карта', fights.Карта),
+                                            self.codes('Размер', fights.Размер))
+            self.source.stream(as_lists(columns), rollover=self.live_points)
+            difference_kd = self.source.data['difference_kd']
+            self.color_mapper.update(low=min(difference_kd), high=max(difference_kd))
+            for key, live in self.rollups:
+                live.update(aggregate(fights, rollup_keys(fights, key)))
+        self.table.update(aggregate(df, 'Результат'))
+        logger.info(f'Live: {len(df)} new fights, {len(fights)} wins and defeats, {self.fights} on Skill-Fights')
+
+
+def live_document(player_name: str, url: str, width: int, height: int, poll_seconds: float):
+    """Session of the bokeh server: the report of the history, then a poll every poll_seconds.
+    The site is polled in a thread, the document is changed in the callback of the server loop"""
+    executor = ThreadPoolExecutor(1)
+
+    def make_document(doc):
+        fights = LiveFights(player_name, url)
+        live = LiveReport(fights.poll(), width, height)
+        doc.title = f'FCStats {player_name}'
+        doc.add_root(live.tabs)
+
+        @gen.coroutine
+        @without_document_lock
+        def poll():
+            df = yield executor.submit(fights.poll)
+            doc.add_next_tick_callback(partial(live.update, df))
+
+        doc.add_periodic_callback(poll, poll_seconds * 1000)
+        doc.on_session_destroyed(lambda context: fights.close())
+
+    return make_document
+
+
+def demo_feed(new_fights: int = DEMO_NEW_FIGHTS, every: float = POLL_SECONDS, seed: int = 0) -> FixtureServer:
+    """fixture_server.FixtureServer with the synthetic history of DEMO_NICK, every few seconds up to
+    new_fights fights are played"""
+    rnd = random.Random(seed)
+    server = FixtureServer({DEMO_NICK: generate_lines(DEMO_FIGHTS, seed, datetime.today())}).start()
+
+    def play():
+        while True:
+            sleep(every)
+            newest = fight_id(server.players[DEMO_NICK][0])
+            server.add_fights(DEMO_NICK, new_fight_lines(newest, rnd.randrange(new_fights + 1), rnd))
+    threading.Thread(target=play, daemon=True).start()
+    return server
+
+
+def main():
+    args = argparse.ArgumentParser(description='FCStats report on a bokeh server, updated with the new fights')
+    args.add_argument('player', nargs='?', help='nickname')
+    args.add_argument('--url', default=FC_URL, help='site to poll, e.g. a fixture_server.py')
+    args.add_argument('--demo', action='store_true', help=f'poll a local feed of synthetic fights of {DEMO_NICK}')
+    args.add_argument('--port', type=int, default=PORT)
+    args.add_argument('--poll', type=float, default=POLL_SECONDS, help='seconds between the polls')
+    args.add_argument('--width', type=int, default=WIDTH)
+    args.add_argument('--height', type=int, default=HEIGHT)
+    args = args.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    if args.demo:
+        feed = demo_feed(every=args.poll)
+        args.player, args.url = DEMO_NICK, feed.url
+    elif not args.player:
+        sys.exit('No player')
+    application = Application(FunctionHandler(live_document(args.player, args.url, args.width, args.height,
+                                                            args.poll)))
+    server = Server({'/': application}, port=args.port)
+    server.start()
+    logger.info(f'Dashboard of {args.player}: http://localhost:{args.port}/')
+    server.io_loop.add_callback(server.show, '/')
+    server.io_loop.start()
+
+
+if __name__ == '__main__':
+    main()
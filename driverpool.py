@@ -0,0 +1,118 @@
+import logging
+from contextlib import contextmanager
+from threading import Condition
+
+# --------------------- CONFIG ---------------------
+# browser sessions kept at the same time
+POOL_SIZE = 2
+# a session is replaced by a fresh one after this number of runs
+MAX_USES = 20
+# seconds to wait for a free session
+ACQUIRE_TIMEOUT = 300
+
+# --------------------------------------------------
+
+logger = logging.getLogger("log")
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class DriverPool:
+    """Warm browser sessions reused by the searches instead of starting a browser every time.
+    factory() starts a session; a session goes back to the pool after a run, it is quit after max_uses runs,
+    after a run that raised and when its health check fails"""
+    def __init__(self, factory, size=POOL_SIZE, max_uses=MAX_USES):
+        self.factory = factory
+        self.size = size
+        self.max_uses = max_uses
+        self.idle = []
+        self.uses = {}
+        self.alive = 0
+        self.closed = False
+        self.condition = Condition()
+
+    @staticmethod
+    def healthy(driver) -> bool:
+        try:
+            driver.current_url
+            return True
+        except Exception as e:
+            logger.warning(f'{type(e).__name__} in browser health check')
+            return False
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.warning(f'{type(e).__name__} in browser quit')
+
+    def _discard(self, driver):
+        self._quit(driver)
+        with self.condition:
+            self.uses.pop(driver, None)
+            self.alive -= 1
+            self.condition.notify()
+
+    def acquire(self, timeout=ACQUIRE_TIMEOUT):
+        while True:
+            with self.condition:
+                if self.closed:
+                    raise PoolTimeout('Pool is closed')
+                if not self.idle and self.alive >= self.size and not self.condition.wait(timeout):
+                    raise PoolTimeout(f'No free browser in {timeout} s')
+                driver = self.idle.pop() if self.idle else None
+                if driver is None and self.alive < self.size:
+                    self.alive += 1
+                    break
+            if driver is not None:
+                if self.healthy(driver):
+                    logger.debug(f'Reuse browser session, runs: {self.uses[driver]}')
+                    return driver
+                self._discard(driver)
+        logger.info(f'Start browser session ({self.alive} of {self.size})')
+        try:
+            driver = self.factory()
+        except Exception:
+            with self.condition:
+                self.alive -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.uses[driver] = 0
+        return driver
+
+    def release(self, driver, broken=False):
+        with self.condition:
+            self.uses[driver] += 1
+            keep = not (broken or self.closed or self.uses[driver] >= self.max_uses)
+            if keep:
+                self.idle.append(driver)
+                self.condition.notify()
+        if not keep:
+            logger.info(f'Recycle browser session, runs: {self.uses[driver]}, broken: {broken}')
+            self._discard(driver)
+
+    @contextmanager
+    def session(self, expected=()):
+        """Session for one run, the expected exceptions don't break it"""
+        driver = self.acquire()
+        try:
+            yield driver
+        except expected:
+            self.release(driver)
+            raise
+        except BaseException:
+            self.release(driver, broken=True)
+            raise
+        self.release(driver)
+
+    def close(self):
+        """Quit the idle sessions, the busy ones are quit when they are released"""
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, []
+        for driver in idle:
+            self._discard(driver)
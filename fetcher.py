@@ -0,0 +1,279 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from threading import Event, Lock
+from time import perf_counter
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from fight_lines import fight_id, only_known
+import profiling
+from page_cache import page_head
+from ratelimit import AdaptiveRateLimiter
+
+# --------------------- CONFIG ---------------------
+FC_URL = 'https://fastcup.net'
+PLAYERS_SEARCH = '/players.html'
+SEARCH_PARAM = 'search'
+PAGE_PARAM = 'page'
+BATTLES_ID = 'mtabs-battles'
+POOL_SIZE = 8
+TIMEOUT = 15
+MAX_RETRIES = 2
+# pages fetched in parallel, the request rate is held by ratelimit.AdaptiveRateLimiter
+WORKERS = 4
+# attempts per page on "429 Too Many Requests"
+MAX_THROTTLED = 8
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) FCStats'}
+
+# --------------------------------------------------
+
+logger = logging.getLogger("log")
+
+# tags after which the browser starts a new line in element.text
+BLOCK_TAGS = {'div', 'p', 'br', 'tr', 'li', 'ul', 'table', 'tbody', 'thead', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+VOID_TAGS = {'br', 'img', 'input', 'hr', 'meta', 'link'}
+
+
+class FetchError(Exception):
+    pass
+
+
+class PlayerNotFoundError(FetchError):
+    pass
+
+
+class FetchCancelled(Exception):
+    """HttpFetcher.cancel was called, not a FetchError: there is nothing to fall back to"""
+    pass
+
+
+class TooManyRequestsError(FetchError):
+    def __init__(self, url: str, retry_after: float = None):
+        super().__init__(f'HTTP 429 on {url}')
+        self.retry_after = retry_after
+
+
+def _retry_after(response: requests.Response):
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+class _ElementText(HTMLParser):
+    """Collect the text of the element with the given id the way selenium's element.text does"""
+    def __init__(self, element_id: str):
+        super().__init__()
+        self.element_id = element_id
+        self.depth = 0
+        self.chunks = []
+        self.found = False
+
+    def handle_starttag(self, tag, attrs):
+        if not self.depth:
+            if dict(attrs).get('id') == self.element_id:
+                self.found = True
+                self.depth = 1
+            return
+        if tag not in VOID_TAGS:
+            self.depth += 1
+        if tag in BLOCK_TAGS:
+            self.chunks.append('\n')
+        elif tag in ('td', 'th'):
+            self.chunks.append(' ')
+
+    def handle_endtag(self, tag):
+        if not self.depth or tag in VOID_TAGS:
+            return
+        self.depth -= 1
+        if tag in BLOCK_TAGS:
+            self.chunks.append('\n')
+
+    def handle_data(self, data):
+        if self.depth:
+            self.chunks.append(data)
+
+    def lines(self) -> [str]:
+        text = ''.join(self.chunks)
+        return [' '.join(line.split()) for line in text.split('\n') if line.strip()]
+
+
+class _PlayerLinks(HTMLParser):
+    """Collect (href, text) of the links in the search results"""
+    def __init__(self):
+        super().__init__()
+        self.links = []
+        self._href = None
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            self._href = dict(attrs).get('href')
+            self._text = []
+
+    def handle_endtag(self, tag):
+        if tag == 'a' and self._href is not None:
+            self.links.append((self._href, ''.join(self._text).strip()))
+            self._href = None
+
+    def handle_data(self, data):
+        if self._href is not None:
+            self._text.append(data)
+
+
+def element_lines(html: str, element_id: str = BATTLES_ID) -> [str]:
+    parser = _ElementText(element_id)
+    parser.feed(html)
+    parser.close()
+    if not parser.found:
+        raise FetchError(f'Element #{element_id} not found')
+    return parser.lines()
+
+
+def number_of_pages(lines: [str]) -> int:
+    """Same rule as in the selenium path: the last token of the pagination line"""
+    return int(lines[0].split()[-1])
+
+
+class HttpFetcher:
+    """Headless fetcher: pulls battle pages over http with a pooled session.
+    progress(pages fetched, number of pages) is called from the fetching threads.
+    With a page_cache.PageCache pages are looked up there before the site"""
+    def __init__(self, base_url=FC_URL, pool_size=POOL_SIZE, timeout=TIMEOUT, workers=WORKERS, limiter=None,
+                 progress=None, cache=None):
+        self.base_url = base_url
+        self.progress = progress
+        self.cache = cache
+        # newest fight of the player, cached pages are valid for it only
+        self.head = None
+        self.cancelled = Event()
+        self.fetched, self.pages = 0, 0
+        self._lock = Lock()
+        self.timeout = timeout
+        self.workers = workers
+        self.limiter = limiter or AdaptiveRateLimiter()
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        # 429 must reach the rate limiter, so urllib3 retries only connection errors
+        retries = Retry(total=MAX_RETRIES, respect_retry_after_header=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def cancel(self):
+        """Requests not sent yet raise FetchCancelled, may be called from any thread"""
+        self.cancelled.set()
+
+    def get(self, url: str, **params) -> requests.Response:
+        for _ in range(MAX_THROTTLED):
+            self.limiter.acquire()
+            if self.cancelled.is_set():
+                raise FetchCancelled(url)
+            try:
+                return self._get(url, **params)
+            except TooManyRequestsError as e:
+                logger.warning(f'{e}, retry after {e.retry_after}')
+                self.limiter.throttle(e.retry_after)
+        raise FetchError(f'Too many requests on {url}')
+
+    def _get(self, url: str, **params) -> requests.Response:
+        try:
+            response = self.session.get(url, params=params or None, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise FetchError(str(e)) from e
+        if response.status_code == 429:
+            raise TooManyRequestsError(response.url, _retry_after(response))
+        self.limiter.success()
+        if response.status_code != 200:
+            raise FetchError(f'HTTP {response.status_code} on {response.url}')
+        response.encoding = response.encoding or 'utf-8'
+        return response
+
+    def find_player(self, player_name: str) -> str:
+        logger.debug('Search player (http)')
+        response = self.get(urljoin(self.base_url, PLAYERS_SEARCH), **{SEARCH_PARAM: player_name})
+        parser = _PlayerLinks()
+        parser.feed(response.text)
+        for href, text in parser.links:
+            if player_name in text and href:
+                return urljoin(response.url, href)
+        raise PlayerNotFoundError(player_name)
+
+    def get_page(self, player_url: str, page: int, fresh: bool = False) -> [str]:
+        """Lines of the battles block, like ExampleApp._get_element_list. fresh: from the site, not from the cache"""
+        with profiling.stage('page'):
+            lines = self.cache.get(player_url, page, self.head) if self.cache and not fresh else None
+            if lines is None:
+                lines = element_lines(self.get(player_url, **{PAGE_PARAM: page}).text)
+                profiling.count('pages_fetched')
+                if self.cache:
+                    self.cache.put(player_url, page, lines, page_head(lines) if page == 1 else self.head)
+            else:
+                profiling.count('pages_cached')
+        with self._lock:
+            self.fetched += 1
+            if self.progress:
+                self.progress(self.fetched, self.pages)
+        return lines
+
+    def data_collection(self, player_url: str, newest: int = None) -> [[str]]:
+        """Same result as ExampleApp.data_collection: one list of fight lines per page.
+        With newest (the last saved fight id) pages are read newest-first until a page has no new fights"""
+        return list(self.iter_pages(player_url, newest))
+
+    def iter_pages(self, player_url: str, newest: int = None):
+        """Pages of data_collection one by one as they arrive, in page order. Every page must have only fights
+        older than the page before, a site that ignores ?page= would repeat the first page: FetchError"""
+        previous = None
+        for number, page in enumerate(self._iter_pages(player_url, newest), 1):
+            ids = [fight_id(line) for line in page]
+            if previous and ids and max(ids) >= min(previous):
+                raise FetchError(f'Page {number} does not follow page {number - 1}: {PAGE_PARAM}= is not paginating')
+            previous = ids or previous
+            yield page
+
+    def _iter_pages(self, player_url: str, newest: int = None):
+        logger.debug('Data collection (http)')
+        if self.cache:
+            self.cache.reset_stats()
+        # an incremental collection is after new fights, they show up on the first page within the live TTL
+        first = self.get_page(player_url, 1, fresh=newest is not None)
+        pages = self.pages = number_of_pages(first)
+        self.head = page_head(first)
+        logger.info(f'Player url: {player_url}, number of pages: {pages}, fetcher: http')
+        try:
+            yield first[2:]
+            if newest is None:
+                yield from self.fetch_pages(player_url, range(2, pages + 1))
+                return
+            last = first[2:]
+            for page in range(2, pages + 1):
+                if only_known(last, newest):
+                    logger.info(f'Incremental collection: {page - 1} of {pages} pages')
+                    break
+                last = self.get_page(player_url, page)[2:]
+                yield last
+        finally:
+            if self.cache:
+                self.cache.log_stats()
+
+    def fetch_pages(self, player_url: str, pages):
+        """Fetch pages in parallel under the rate limiter, they are yielded in page order"""
+        pages = list(pages)
+        if not pages:
+            return
+        start, throttled = perf_counter(), self.limiter.throttled
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for lines in pool.map(lambda page: self.get_page(player_url, page), pages):
+                yield lines[2:]
+        # cached pages may take no time at all
+        duration = max(perf_counter() - start, 1e-9)
+        logger.info(f'Fetched {len(pages)} pages in {duration:.2f}s ({len(pages) / duration:.1f} pages/s), '
+                    f'HTTP 429: {self.limiter.throttled - throttled}, rate: {self.limiter.rate:.1f} req/s')
@@ -0,0 +1,11 @@
+"""Fight lines of the battle pages ("#123 12 января 2019 20:15 CS ..."), without dependencies:
+the fetchers and the page cache need the fight ids only"""
+
+
+def fight_id(line: str) -> int:
+    return int(line.split(maxsplit=1)[0].lstrip('#'))
+
+
+def only_known(page: [str], newest: int) -> bool:
+    """Page without fights newer than the last saved one"""
+    return all(fight_id(line) <= newest for line in page)
@@ -0,0 +1,125 @@
+"""Local stand-in for fastcup: serves saved stats files as battle pages, so the http fetcher works offline.
+
+    python fixture_server.py --port 8000 nick=Fights_nick.txt [nick2=...]
+"""
+import argparse
+import threading
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from fetcher import PLAYERS_SEARCH, SEARCH_PARAM, PAGE_PARAM, BATTLES_ID
+
+# --------------------- CONFIG ---------------------
+PAGE_SIZE = 20
+HOST = '127.0.0.1'
+
+# --------------------------------------------------
+
+HEADER = 'Игра Дата Тип Размер Карта Сторона Результат K/D Скилл Опыт'
+
+
+def render_search(players: [str], query: str) -> str:
+    links = ''.join(f'<div class="msg"><a href="/id{i}">{escape(nick)}</a></div>'
+                    for i, nick in enumerate(players) if query and query in nick)
+    return f'<html><body><div class="right_col_textbox">{links}</div></body></html>'
+
+
+def render_battles(lines: [str], page: int, page_size: int = PAGE_SIZE) -> str:
+    pages = max(1, -(-len(lines) // page_size))
+    pagination = ' '.join(f'<a href="?{PAGE_PARAM}={i}">{i}</a>' for i in range(1, pages + 1))
+    rows = ''.join(f'<tr><td>{escape(line)}</td></tr>'
+                   for line in lines[(page - 1) * page_size:page * page_size])
+    return (f'<html><body><div id="{BATTLES_ID}"><div class="pages">{pagination}</div>'
+            f'<div class="head">{HEADER}</div><table>{rows}</table></div></body></html>')
+
+
+class FixtureServer:
+    """Serve {nick: [fight lines, newest first]} on a local port"""
+    def __init__(self, players: dict, port: int = 0, page_size: int = PAGE_SIZE, throttle_every: int = 0):
+        self.players = players
+        self.nicks = list(players)
+        self.page_size = page_size
+        # answer every n-th request with "429 Too Many Requests", like fastcup does
+        self.throttle_every = throttle_every
+        self.requests_count = 0
+        self.server = ThreadingHTTPServer((HOST, port), self._handler())
+        self.thread = None
+
+    def add_fights(self, nick: str, lines: [str]):
+        """New fights of the player, newest first: they go on top of the first page like on the site"""
+        # a new list, a request being served keeps the old one
+        self.players[nick] = lines + self.players[nick]
+
+    @property
+    def url(self) -> str:
+        return 'http://%s:%d' % self.server.server_address[:2]
+
+    def _handler(self):
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fixture.requests_count += 1
+                if fixture.throttle_every and not fixture.requests_count % fixture.throttle_every:
+                    self.send_response(429)
+                    self.send_header('Retry-After', '1')
+                    self.end_headers()
+                    return
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if url.path == PLAYERS_SEARCH:
+                    body = render_search(fixture.nicks, query.get(SEARCH_PARAM, [''])[0])
+                elif url.path.startswith('/id') and url.path[3:].isdigit() and int(url.path[3:]) < len(fixture.nicks):
+                    lines = fixture.players[fixture.nicks[int(url.path[3:])]]
+                    body = render_battles(lines, int(query.get(PAGE_PARAM, ['1'])[0]), fixture.page_size)
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'FixtureServer':
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    args = argparse.ArgumentParser(description='Serve saved stats files as fastcup battle pages')
+    args.add_argument('players', nargs='+', help='nick=path/to/saved.txt')
+    args.add_argument('--port', type=int, default=8000)
+    args.add_argument('--page-size', type=int, default=PAGE_SIZE)
+    args.add_argument('--throttle-every', type=int, default=0, help='answer every n-th request with HTTP 429')
+    args = args.parse_args()
+    players = {}
+    for item in args.players:
+        nick, file_name = item.split('=', 1)
+        with open(file_name, 'r', encoding='utf-8') as f:
+            players[nick] = [line for line in f.read().split('\n') if line]
+    server = FixtureServer(players, args.port, args.page_size, args.throttle_every)
+    print(f'Serving {", ".join(players)} on {server.url}')
+    server.server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
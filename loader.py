@@ -0,0 +1,130 @@
+"""Saved fights: stats text files and fight stores"""
+import logging
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+from os import path
+
+from pandas import DataFrame
+
+from aggregation import cube
+from parsing import FightBuffer
+from schema import concat_compact, memory_usage
+from store import FightStore
+
+# --------------------- CONFIG ---------------------
+# processes parsing the text files of a Union
+LOAD_WORKERS = 4
+# bytes of a text file parsed at once, the file is memory-mapped
+BLOCK_BYTES = 2 ** 20
+
+# --------------------------------------------------
+
+logger = logging.getLogger("log")
+
+# player of the fight: the nick of the file it was loaded from (Fights_<nick>.txt) or its player in a store
+SOURCE = "Источник"
+FILE_PREFIX = "Fights_"
+
+
+def read_blocks(path_to_file: str, block_size: int = BLOCK_BYTES):
+    """Text of the file by blocks of whole lines. The file is memory-mapped: only the current block
+    is a python string, the pages of the file are left to the OS"""
+    with open(path_to_file, 'rb') as f:
+        if not path.getsize(path_to_file):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = 0
+            while start < len(data):
+                # up to the first line end after block_size bytes
+                end = data.find(b'\n', min(start + block_size, len(data)))
+                end = len(data) if end == -1 else end + 1
+                # files saved on windows have \r\n, f.read() in text mode used to drop \r
+                yield data[start:end].decode('utf-8').replace('\r\n', '\n')
+                start = end
+
+
+def load_file(path_to_file: str) -> DataFrame:
+    """Fights of one text file tagged with its player (player_name) or of a fight store tagged with their players,
+    a text file is parsed by blocks (read_blocks)"""
+    if path_to_file.endswith('.sqlite'):
+        with FightStore(path_to_file) as store:
+            return store.load(player_column=SOURCE)
+    buffer = FightBuffer()
+    for text in read_blocks(path_to_file):
+        buffer.append_text(text)
+    df = buffer.frame()
+    df[SOURCE] = player_name(path_to_file)
+    return df
+
+
+def load_files(path_to_files: [str], workers: int = LOAD_WORKERS) -> (DataFrame, DataFrame):
+    """Fights of text files and fight stores together with their rollup cube, sorted by date.
+    The files are parsed in a process pool, a played fight found in several files with all the parsed columns
+    equal is kept once, from the first of them, and the files sharing it are one player (same_players).
+    Fights that were not played ("Не состоялся", "Ошибка") have no stats to tell teammates apart and are all kept"""
+    if len(path_to_files) > 1 and workers > 1:
+        with ProcessPoolExecutor(min(workers, len(path_to_files))) as pool:
+            dfs = list(pool.map(load_file, path_to_files))
+    else:
+        dfs = [load_file(path_to_file) for path_to_file in path_to_files]
+    df = concat_compact(dfs)
+    columns = [column for column in df.columns if column != SOURCE]
+    shared = df.duplicated(columns, keep=False) & played(df)
+    if shared.any():
+        df[SOURCE] = df[SOURCE].astype(object).replace(same_players(df[shared], columns))
+    df[SOURCE] = df[SOURCE].astype('category')
+    duplicated = df.duplicated(columns) & shared
+    if duplicated.any():
+        logger.info(f'Union: {duplicated.sum()} duplicate fights skipped')
+        df = df[~duplicated]
+    # stable, a single file keeps the order of parsing.parse_fights
+    df = df.sort_values('Дата', kind='mergesort')
+    logger.info(f'Files: {len(path_to_files)}, fights: {len(df)}, memory: {memory_usage(df) / 2 ** 20:.2f} MB')
+    if len(path_to_files) == 1 and path_to_files[0].endswith('.sqlite') and not duplicated.any():
+        # the rollups of a store are already there
+        with FightStore(path_to_files[0]) as store:
+            return df, store.load_cube()
+    return df, cube(df)
+
+
+def same_players(shared: DataFrame, columns: [str]) -> dict:
+    """{player: player of the first file} of files that share played fights with all the columns equal:
+    overlapping dumps of one player (Fights_a.txt, Fights_b.txt) are one player of the roster"""
+    first = shared.groupby(columns, observed=True, sort=False)[SOURCE].transform('first').astype(str)
+    names = shared[SOURCE].astype(str)
+    # files in the order they were loaded, the first of the same player names them
+    order = {name: i for i, name in enumerate(dict.fromkeys(names))}
+    parent = {}
+
+    def root(name):
+        while parent.get(name, name) != name:
+            name = parent[name]
+        return name
+
+    for name, other in set(zip(names, first)):
+        name, other = sorted((root(name), root(other)), key=order.get)
+        if name != other:
+            parent[other] = name
+    players = {name: root(name) for name in order if root(name) != name}
+    for name, player in players.items():
+        logger.info(f'Union: {name} is the same player as {player}')
+    return players
+
+
+def player_name(path_to_file: str) -> str:
+    """Nick of a stats file saved as Fights_<nick>.txt, the name of any other file"""
+    name = report_name([path_to_file])
+    return name[len(FILE_PREFIX):] if name.startswith(FILE_PREFIX) and name != FILE_PREFIX else name
+
+
+def played(df: DataFrame):
+    """Fights with a result, not "Не ..." or "Ошибка" """
+    result = df.Результат.astype(str)
+    return ~(result.str.startswith('Не ') | (result == 'Ошибка'))
+
+
+def report_name(path_to_files: [str]) -> str:
+    """Name of the file without extension, Union for several files"""
+    if len(path_to_files) == 1:
+        return path.splitext(path.basename(path_to_files[0]))[0]
+    return 'Union'
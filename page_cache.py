@@ -0,0 +1,109 @@
+import logging
+import sqlite3
+import zlib
+from os import path, makedirs
+from threading import Lock
+from time import time
+
+from fight_lines import fight_id
+
+# --------------------- CONFIG ---------------------
+CACHE_DIRECTORY = 'data'
+CACHE_FILE = 'pages.sqlite'
+# seconds: the first page is live, new fights show up there
+LIVE_TTL = 60
+HISTORY_TTL = 30 * 24 * 3600
+MAX_BYTES = 64 * 2 ** 20
+
+# --------------------------------------------------
+
+logger = logging.getLogger("log")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    player TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    head INTEGER,             -- newest fight of the player when the page was fetched
+    fetched REAL NOT NULL,
+    used REAL NOT NULL,
+    size INTEGER NOT NULL,
+    lines BLOB NOT NULL,      -- zlib of the lines joined by newlines
+    PRIMARY KEY (player, page)
+) WITHOUT ROWID;
+"""
+
+
+def page_head(lines: [str]):
+    """Newest fight id of the first page (lines of fetcher.element_lines), None without fights"""
+    try:
+        return fight_id(lines[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PageCache:
+    """Battle pages on disk keyed by (player, page), least recently used pages are evicted above max_bytes.
+    Every new fight shifts all the pages of a player by one line, so a historic page is valid only while
+    the head (the newest fight on the first page) is the one it was fetched with"""
+    def __init__(self, file_name=path.join(CACHE_DIRECTORY, CACHE_FILE), live_ttl=LIVE_TTL,
+                 history_ttl=HISTORY_TTL, max_bytes=MAX_BYTES):
+        directory = path.dirname(file_name)
+        if directory and not path.exists(directory):
+            makedirs(directory)
+        self.live_ttl = live_ttl
+        self.history_ttl = history_ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        # the fetcher threads share the connection under the lock
+        self.connection = sqlite3.connect(file_name, timeout=60, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, player: str, page: int, head=None):
+        """Lines of the page or None; page 1 is checked by age only, the others by age and head"""
+        ttl = self.live_ttl if page == 1 else self.history_ttl
+        with self._lock:
+            row = self.connection.execute("SELECT head, fetched, lines FROM pages WHERE player = ? AND page = ?",
+                                          (player, page)).fetchone()
+            if row is None or time() - row[1] > ttl or page > 1 and (head is None or row[0] != head):
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self.connection:
+                self.connection.execute("UPDATE pages SET used = ? WHERE player = ? AND page = ?",
+                                        (time(), player, page))
+        return zlib.decompress(row[2]).decode('utf-8').split('\n')
+
+    def put(self, player: str, page: int, lines: [str], head):
+        data = zlib.compress('\n'.join(lines).encode('utf-8'))
+        now = time()
+        with self._lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    (player, page, head, now, now, len(data), data))
+            self._evict()
+
+    def _evict(self):
+        total = self.connection.execute("SELECT coalesce(sum(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for player, page, size in self.connection.execute("SELECT player, page, size FROM pages ORDER BY used"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((player, page))
+            total -= size
+        self.connection.executemany("DELETE FROM pages WHERE player = ? AND page = ?", evicted)
+        logger.info(f'Page cache: evicted {len(evicted)} pages')
+
+    def reset_stats(self):
+        """Start the hit/miss counters of a new collection, the cache lives longer than one"""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def log_stats(self):
+        logger.info(f'Page cache: {self.hits} hits, {self.misses} misses')
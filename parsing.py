@@ -0,0 +1,287 @@
+import logging
+import re
+from datetime import datetime, timedelta
+
+import numpy as np
+from pandas import DataFrame, DatetimeIndex, factorize, to_numeric
+
+import profiling
+from schema import apply_schema, compact, concat_compact, memory_usage
+
+logger = logging.getLogger("log")
+
+LABELS = ["Игра", "Дата", "Время", "Год", "Месяц", "День", "Час", "Минуты", "Канал", "Размер", "Карта",
+          "Сторона", "Результат", "Фраги", "Смерти", "Скилл", "Деление", "Опыт"]
+MONTH_TO_NUM = dict(января='01', февраля='02', марта='03', апреля='04', мая='05', июня='06',
+                    июля='07', августа='08', сентября='09', октября='10', ноября='11', декабря='12')
+DAYS_TO_INT = dict(Сегодня=0, Вчера=1, Позавчера=2)
+# lines parsed at once by FightBuffer, 100 pages
+BATCH_LINES = 2000
+
+# one fight per line: fight, date tokens up to "CS" (absolute "12 января 2019 20:15" or relative "Сегодня 20:15",
+# "5 мин назад ..."), channel (3 tokens), one skipped token, size (3 tokens), map, side, result and up to four
+# tokens after it: k/d, skill, separator "(...)" and experience. [ \t] instead of \s keeps a match inside its line
+SPACE, TOKEN = r'[ \t]+', r'[^\s]+'
+FIGHT_LINE = re.compile(
+    rf'^[ \t]*({TOKEN}){SPACE}'
+    rf'(?:(\d+{SPACE}{TOKEN}{SPACE}\d+){SPACE}(\d+:\d+)|(.*?)){SPACE}'
+    rf'(CS{SPACE}{TOKEN}{SPACE}{TOKEN}){SPACE}{TOKEN}{SPACE}'
+    rf'({TOKEN}{SPACE}{TOKEN}{SPACE}{TOKEN}){SPACE}({TOKEN}){SPACE}({TOKEN}){SPACE}({TOKEN})'
+    rf'(?:{SPACE}(?:([+-]?\d+)/([+-]?\d+)|({TOKEN})))?'
+    rf'(?:{SPACE}({TOKEN}))?(?:{SPACE}({TOKEN}))?(?:{SPACE}({TOKEN}))?', re.MULTILINE)
+GROUPS = ['fight', 'date', 'time', 'when', 'channel', 'size', 'map', 'side', 'result', 'k', 'd', 't1', 't2', 't3',
+          't4']
+
+
+def get_date_time(lst_dt: [str], now: datetime = None) -> (str, str):
+    now = now or datetime.today()
+    if len(lst_dt) == 4:
+        if lst_dt[2] == 'назад':
+            date = now.strftime("%Y-%m-%d")
+            time = now.strftime("%H:%M")
+            if 'мин' in lst_dt[1]:
+                time = (now - timedelta(minutes=int(lst_dt[0]))).strftime("%H:%M")
+        else:
+            time = lst_dt[3]
+            lst_dt[0] = lst_dt[0].zfill(2)
+            lst_dt[1] = MONTH_TO_NUM[lst_dt[1]]
+            date = '-'.join(lst_dt[2::-1])
+    else:
+        time = lst_dt[1]
+        date = (now - timedelta(days=DAYS_TO_INT[lst_dt[0]])).strftime("%Y-%m-%d")
+    return date, time
+
+
+def data_preparation(data: str, now: datetime = None) -> [list]:
+    """
+    Don't try to understand it, just believe"""
+    logger.debug('Data preparation')
+    with profiling.stage('data_preparation'):
+        return _data_preparation(data, now)
+
+
+def _data_preparation(data: str, now: datetime = None) -> [list]:
+    dt = []
+    for line in data.split("\n"):
+        if not line:
+            continue
+        ln = line.split()
+        x = ln.index("CS")
+        fight = ln[0]
+        date, time = get_date_time(ln[1:x], now)
+        year, month, day = date.split('-')
+        hour, minutes = time.split(':')
+        type_game = " ".join(ln[x:x+3])
+        xvsx = "".join(ln[x+4:x+7])
+        mp = ln[x+7]
+        side, result, k, d, sep = "", "", "", "", ""
+        points = 0.0
+        exp = 0
+        side = "T" if ln[x+8] == "A" else "CT"
+        if ln[x+9] == "Не":
+            result = " ".join(ln[x+9:x+11])
+        elif ln[x+9] == "Ошибка":
+            result = ln[x+9]
+        else:
+            result = ln[x+9]
+            try:
+                k, d = map(int, ln[x+10].split('/'))
+            except ValueError:
+                k, d = 0, 0
+            try:
+                points = float(ln[x+11])
+            except IndexError:
+                points = 0.0
+            try:
+                if ln[x+12][0] == "(":
+                    sep = ln[x+12]
+                    exp = ln[x+13]
+                else:
+                    sep = ""
+                    try:
+                        exp = ln[x+12]
+                    except IndexError:
+                        pass
+            except IndexError:
+                pass
+        dt.append([fight, date, time, year, month, day, hour, minutes, type_game,
+                  xvsx, mp, side, result, k, d, points, sep, exp])
+    return dt
+
+
+def create_dataframe(dt: [list]) -> DataFrame:
+    with profiling.stage('create_dataframe'):
+        df = DataFrame.from_records(dt, columns=LABELS).iloc[::-1]
+        df['Дата'] = df.Дата.astype('datetime64[ns]')
+        df['ДеньНедели'] = [str(date.isoweekday()) for date in df.Дата]
+        # stable: the fights of a day stay in the order played, oldest first
+        df = df.sort_values('Дата', kind='mergesort')
+    return df
+
+
+def _per_unique(values: np.ndarray, func) -> np.ndarray:
+    """func(value) for every value, called once per distinct value"""
+    codes, uniques = factorize(values)
+    results = np.empty(len(uniques), dtype=object)
+    for i, value in enumerate(uniques):
+        results[i] = func(value)
+    return results[codes]
+
+
+class DateParser:
+    """Dates of one run: "now" is fixed once and every distinct date token is parsed once,
+    the cache lives as long as the parser, so pages of one collection share it"""
+    def __init__(self, now: datetime = None):
+        self.now = now or datetime.today()
+        self.days = {}
+        self.times = {}
+
+    def _day(self, date: str, when: str) -> (np.datetime64, str):
+        """'12 января 2019' or a relative 'Сегодня 20:15', '5 мин назад ...' -> (day, time of the relative date)"""
+        if date:
+            day, month, year = date.split()
+            return np.datetime64('-'.join([year, MONTH_TO_NUM[month], day.zfill(2)])), None
+        date, time = get_date_time(when.split(), self.now)
+        return np.datetime64(date), time
+
+    def _time(self, time: str) -> (int, int):
+        hour, minutes = time.split(':')
+        return int(hour), int(minutes)
+
+    def __call__(self, date: np.ndarray, time: np.ndarray, when: np.ndarray) -> dict:
+        """Columns Дата (datetime64), Время and integer Год, Месяц, День, Час, Минуты, ДеньНедели"""
+        key = np.where(date == '', when, date)
+        codes, keys = factorize(key)
+        first = np.unique(codes, return_index=True)[1]
+        parsed = [self.days.get(k) or self.days.setdefault(k, self._day(d, w))
+                  for k, d, w in zip(keys, date[first], when[first])]
+        days = DatetimeIndex(np.array([day for day, _ in parsed], dtype='datetime64[ns]'))
+        relative_time = np.array([t or '' for _, t in parsed], dtype=object)[codes]
+        time = np.where(time == '', relative_time, time)
+        codes_time, times = factorize(time)
+        hm = np.array([self.times.get(t) or self.times.setdefault(t, self._time(t)) for t in times],
+                      dtype=np.int64).reshape(-1, 2)[codes_time]
+        return {
+            "Дата": days.values[codes],
+            "Время": time,
+            "Год": days.year.values.astype(np.int64)[codes],
+            "Месяц": days.month.values.astype(np.int64)[codes],
+            "День": days.day.values.astype(np.int64)[codes],
+            "Час": hm[:, 0],
+            "Минуты": hm[:, 1],
+            "ДеньНедели": (days.dayofweek.values + 1).astype(np.int64)[codes]
+        }
+
+
+def parse_fights(data: str, now: datetime = None, date_parser: DateParser = None) -> DataFrame:
+    """Vectorized create_dataframe(data_preparation(data)): one regex pass over the whole text, then every
+    column is built with numpy masks, the string work is done once per distinct value (dates, maps, sizes).
+    Unlike create_dataframe the columns have the dtypes of schema.apply_schema"""
+    logger.debug('Data preparation (vectorized)')
+    df = _parse_rows(data, date_parser or DateParser(now)).iloc[::-1]
+    df = df.sort_values('Дата', kind='mergesort')
+    return apply_schema(df)
+
+
+def _parse_rows(data: str, date_parser: DateParser) -> DataFrame:
+    """Fights of the text in the order of its lines, with the dtypes of the parser"""
+    with profiling.stage('parse'):
+        df = _parse_lines(data, date_parser)
+    profiling.count('fights', len(df))
+    return df
+
+
+def _parse_lines(data: str, date_parser: DateParser) -> DataFrame:
+    rows = FIGHT_LINE.findall(data)
+    lines = data.split("\n")
+    lines = len(lines) - lines.count("")
+    if len(rows) != lines:
+        logger.warning(f'Skipped {lines - len(rows)} unparsed lines')
+        profiling.count('unparsed_lines', lines - len(rows))
+    parts = dict(zip(GROUPS, np.array(rows, dtype=object).reshape(-1, len(GROUPS)).T))
+    n = len(rows)
+
+    dates = date_parser(parts['date'], parts['time'], parts['when'])
+
+    # result and the tokens after it
+    result = parts['result']
+    not_played = result == "Не"
+    played = ~(not_played | (result == "Ошибка"))
+    result = result.copy()
+    result[not_played] = [" ".join(filter(None, [r, t1, k and k + '/' + d])) for r, t1, k, d in
+                          zip(result[not_played], *(parts[g][not_played] for g in ('t1', 'k', 'd')))]
+    kd_ok = played & (parts['k'] != '')
+    k = np.zeros(n, dtype=np.int64)
+    d = k.copy()
+    k[kd_ok] = parts['k'][kd_ok].astype(np.int64)
+    d[kd_ok] = parts['d'][kd_ok].astype(np.int64)
+    points = np.zeros(n)
+    has_points = played & (parts['t2'] != '')
+    points[has_points] = parts['t2'][has_points].astype(float)
+    has_sep = played & np.array([t[:1] == "(" for t in parts['t3']], dtype=bool)
+    sep = np.where(has_sep, parts['t3'], "").astype(object)
+    exp = np.zeros(n, dtype=object)
+    with_exp = has_sep & (parts['t4'] != '')
+    exp[with_exp] = parts['t4'][with_exp]
+    no_sep = played & ~has_sep & (parts['t3'] != '')
+    exp[no_sep] = parts['t3'][no_sep]
+    # text that isn't a number (a broken line) is 0, as in schema.compact
+    exp = np.nan_to_num(to_numeric(exp, errors='coerce'))
+
+    return DataFrame({
+        "Игра": parts['fight'],
+        **dates,
+        "Канал": _per_unique(parts['channel'], lambda channel: " ".join(channel.split())),
+        "Размер": _per_unique(parts['size'], lambda size: "".join(size.split())),
+        "Карта": parts['map'],
+        "Сторона": np.where(parts['side'] == "A", "T", "CT").astype(object),
+        "Результат": result,
+        "Фраги": k,
+        "Смерти": d,
+        "Скилл": points,
+        "Деление": sep,
+        "Опыт": exp
+    }, columns=LABELS + ["ДеньНедели"])
+
+
+class FightBuffer:
+    """Fights of pages that are still arriving: every batch_lines lines are parsed into a compact chunk,
+    so the pages are not kept until the end. frame() is parse_fights of all the lines appended"""
+    def __init__(self, now: datetime = None, batch_lines: int = BATCH_LINES):
+        self.date_parser = DateParser(now)
+        self.batch_lines = batch_lines
+        self.lines = []
+        self.chunks = []
+        self.rows = 0
+
+    def __len__(self) -> int:
+        return self.rows + len(self.lines)
+
+    def append(self, page: [str]):
+        self.lines.extend(page)
+        if len(self.lines) >= self.batch_lines:
+            self._flush()
+
+    def append_text(self, text: str):
+        """Whole lines at once, like a block of a saved file: parsed right away without splitting them"""
+        self._flush()
+        self._parse(text)
+
+    def _flush(self):
+        if self.lines:
+            self._parse("\n".join(self.lines))
+            self.lines = []
+
+    def _parse(self, text: str):
+        self.chunks.append(compact(_parse_rows(text, self.date_parser)))
+        self.rows += len(self.chunks[-1])
+
+    def frame(self) -> DataFrame:
+        self._flush()
+        if not self.chunks:
+            return parse_fights('', date_parser=self.date_parser)
+        # the joined chunks replace them, so the chunks and the sorted copy are never kept together
+        self.chunks = [concat_compact(self.chunks)]
+        df = self.chunks[0].iloc[::-1].sort_values('Дата', kind='mergesort')
+        logger.info(f'Fights: {len(df)}, memory: {memory_usage(df) / 2 ** 20:.2f} MB')
+        return df
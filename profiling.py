@@ -0,0 +1,151 @@
+"""Stage timers and counters of one run (a report of the window or of batch.py) and its JSON summary.
+The hot paths call stage()/count() of the current run, they do nothing when there is no run"""
+import cProfile
+import io
+import json
+import logging
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from os import path, makedirs
+from threading import Lock
+from time import perf_counter, strftime, localtime
+
+# --------------------- CONFIG ---------------------
+# cProfile of the thread that runs the run, saved as <summary>.prof
+PROFILE = False
+# peak memory and the top allocations of the run
+TRACE_MEMORY = False
+# functions of the cProfile and allocations of tracemalloc in the summary
+TOP = 20
+
+# --------------------------------------------------
+
+logger = logging.getLogger("log")
+
+_current = None
+
+
+class Run:
+    """Seconds (calls, total, max) of every stage and counters, shared by the threads of the run"""
+    def __init__(self, name: str, profile: bool = PROFILE, trace_memory: bool = TRACE_MEMORY):
+        self.name = name
+        self.profile = cProfile.Profile() if profile else None
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.counters = {}
+        self.memory = None
+        self.started = localtime()
+        self.seconds = 0.0
+        self._lock = Lock()
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            calls, total, longest = self.stages.get(name, (0, 0.0, 0.0))
+            self.stages[name] = (calls + 1, total + seconds, max(longest, seconds))
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def stage(self, name: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, perf_counter() - start)
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.profile:
+            self.profile.enable()
+        self.seconds = perf_counter()
+
+    def stop(self):
+        self.seconds = perf_counter() - self.seconds
+        if self.profile:
+            self.profile.disable()
+        if self.trace_memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.memory = dict(current_mb=round(current / 2 ** 20, 2), peak_mb=round(peak / 2 ** 20, 2),
+                               top=[str(stat) for stat in snapshot.statistics('lineno')[:TOP]])
+
+    def summary(self) -> dict:
+        """Stages sorted by total time"""
+        stages = {name: dict(calls=calls, seconds=round(total, 4), max_seconds=round(longest, 4))
+                  for name, (calls, total, longest) in sorted(self.stages.items(), key=lambda s: -s[1][1])}
+        summary = dict(run=self.name, started=strftime('%Y-%m-%d %H:%M:%S', self.started),
+                       seconds=round(self.seconds, 4), stages=stages, counters=dict(self.counters))
+        if self.memory:
+            summary['memory'] = self.memory
+        if self.profile:
+            text = io.StringIO()
+            pstats.Stats(self.profile, stream=text).sort_stats('cumulative').print_stats(TOP)
+            summary['profile'] = text.getvalue().splitlines()
+        return summary
+
+    def write(self, directory: str) -> str:
+        """<directory>/run_<time>_<name>.json (and .prof with cProfile), the file name of the summary"""
+        if not path.exists(directory):
+            makedirs(directory)
+        name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in self.name)
+        file_name = path.join(directory, f"run_{strftime('%Y-%m-%d_%H-%M-%S', self.started)}_{name}.json")
+        with open(file_name, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2, ensure_ascii=False)
+        if self.profile:
+            self.profile.dump_stats(path.splitext(file_name)[0] + '.prof')
+        return file_name
+
+    def log(self):
+        for name, (calls, total, longest) in sorted(self.stages.items(), key=lambda s: -s[1][1]):
+            logger.info(f'Stage {name}: {calls} calls, {total:.3f} s, max {longest:.3f} s')
+        if self.counters:
+            logger.info('Counters: ' + ', '.join(f'{name} {n}' for name, n in self.counters.items()))
+
+
+@contextmanager
+def run(name: str, directory: str, profile: bool = PROFILE, trace_memory: bool = TRACE_MEMORY):
+    """The run of the block: its stages are logged and written to the directory when it ends, failed or not"""
+    global _current
+    current = _current = Run(name, profile, trace_memory)
+    current.start()
+    try:
+        yield current
+    finally:
+        current.stop()
+        _current = None
+        current.log()
+        try:
+            logger.info(f'Run summary: {current.write(directory)}')
+        except OSError as e:
+            logger.warning(f'{e} in run summary')
+
+
+def stage(name: str):
+    """Timer of a stage of the current run"""
+    return _current.stage(name) if _current is not None else _NO_STAGE
+
+
+def record(name: str, seconds: float):
+    if _current is not None:
+        _current.record(name, seconds)
+
+
+def count(name: str, n: int = 1):
+    if _current is not None:
+        _current.count(name, n)
+
+
+class _NoStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
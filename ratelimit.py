@@ -0,0 +1,55 @@
+import threading
+from time import monotonic, sleep
+
+# --------------------- CONFIG ---------------------
+# requests per second
+START_RATE = 4.0
+MIN_RATE = 0.5
+MAX_RATE = 20.0
+BURST = 4
+# on success the rate grows by RATE_STEP, on 429 it is multiplied by BACKOFF
+RATE_STEP = 0.5
+BACKOFF = 0.5
+DEFAULT_RETRY_AFTER = 1.0
+
+# --------------------------------------------------
+
+
+class AdaptiveRateLimiter:
+    """Token bucket shared by the fetch threads: backs off on "429 Too Many Requests", speeds up on success"""
+    def __init__(self, rate=START_RATE, burst=BURST, min_rate=MIN_RATE, max_rate=MAX_RATE):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.tokens = float(burst)
+        self.updated = monotonic()
+        self.paused_until = 0.0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            sleep(wait)
+
+    def success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + RATE_STEP)
+
+    def throttle(self, retry_after: float = None):
+        with self.lock:
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate * BACKOFF)
+            self.tokens = 0
+            self.paused_until = max(self.paused_until, monotonic() + (retry_after or DEFAULT_RETRY_AFTER))
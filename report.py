@@ -0,0 +1,689 @@
+"""Bokeh report of a fight history, used by the window (FCStats.py) and by the batch mode (batch.py)"""
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from os import path, makedirs
+from shutil import copyfile
+from time import perf_counter
+
+import numpy as np
+from pandas import DataFrame, Series
+from bokeh.embed import file_html
+from bokeh.models import ColumnDataSource, OpenURL, TapTool, WheelZoomTool, LinearColorMapper, \
+    BasicTicker, PrintfTickFormatter, ColorBar, HoverTool, FactorRange, CustomJSHover
+from bokeh.layouts import column
+from bokeh.palettes import Category20, RdYlGn
+from bokeh.plotting import figure
+from bokeh.resources import CDN, INLINE, Resources
+from bokeh.util.paths import bokehjsdir
+from bokeh.models.widgets import Panel, Tabs, DataTable, TableColumn, NumberFormatter, DateFormatter
+from bokeh.transform import dodge
+
+import profiling
+from aggregation import WIN, DEFEAT, cube, rollup
+from roster import PLAYER, ranking
+from trends import ROLLING_FIGHTS, MAP_FIGHTS, form, longest_streaks
+
+# --------------------- CONFIG ---------------------
+# size of the charts when there is no screen to fit
+WIDTH = 1600
+HEIGHT = 800
+# threads for the rollups of the report tabs
+CHART_WORKERS = 4
+# Skill-Fights with more points is drawn with WebGL
+WEBGL_POINTS = 5000
+# Skill-Fights with more points shows only the worst and the best fight of every bucket of LOD_BUCKETS fights in a row
+LOD_POINTS = 20000
+LOD_BUCKETS = 5000
+# BokehJS of the reports: 'local' - copied once to static/ next to the reports, works offline,
+# 'inline' - inside every report, 'cdn' - loaded from the internet
+RESOURCES = 'local'
+
+# --------------------------------------------------
+
+logger = logging.getLogger("log")
+
+# integer date parts are zero-padded like the text they were parsed from, the day of the week never was
+FACTOR_FORMATS = {'ДеньНедели': '%d'}
+
+
+def timed(func, *args, **kwargs):
+    """(result, seconds)"""
+    start = perf_counter()
+    result = func(*args, **kwargs)
+    return result, perf_counter() - start
+
+
+def replace_unsupported_chars(string: str) -> str:
+    for i in r'/\:*?«<>|"':
+        string = string.replace(i, '_')
+    return string
+
+
+def packed(values) -> np.ndarray:
+    """Numbers in the smallest dtype that bokeh writes base64-encoded, int64 and lists are written as JSON lists"""
+    values = np.asarray(values)
+    if values.dtype.kind in 'iub' and len(values):
+        dtype = np.result_type(np.min_scalar_type(values.min()), np.min_scalar_type(values.max()))
+        if dtype.itemsize <= 4:
+            return values.astype(dtype)
+    return values
+
+
+def fight_ids(fights) -> np.ndarray:
+    """'#123' -> 123, the ids stay text if some of them aren't numbers"""
+    ids = [fight[1:] for fight in fights]
+    try:
+        return packed(np.array(ids, dtype=np.int64))
+    except ValueError:
+        return ids
+
+
+def factor_codes(values) -> (np.ndarray, [str]):
+    """Text of every fight -> codes and the texts of the codes"""
+    values = Series(values).astype('category')
+    return packed(values.cat.codes.values), [str(name) for name in values.cat.categories]
+
+
+def names_formatter(names: [str]) -> CustomJSHover:
+    """Tooltip formatter ('@column{custom}') that shows the text of a code of factor_codes"""
+    # args of CustomJSHover are models only, the names are a literal of the code
+    return CustomJSHover(code=f"return {json.dumps(names)}[value]")
+
+
+def report_resources(directory: str, mode: str = RESOURCES) -> Resources:
+    """BokehJS for a report in the directory, see RESOURCES"""
+    if mode == 'inline':
+        return INLINE
+    if mode == 'cdn':
+        return CDN
+    resources = Resources(mode='server', root_url='./')
+    for kind in ('js', 'css'):
+        static = path.join(directory, 'static', kind)
+        if not path.exists(static):
+            makedirs(static)
+        for component in resources.components(kind):
+            file_name = f'{component}.min.{kind}'
+            if not path.exists(path.join(static, file_name)):
+                copyfile(path.join(bokehjsdir(), kind, file_name), path.join(static, file_name))
+    return resources
+
+
+def write_report(tabs, file_name: str, title: str = 'FCStats', resources: str = RESOURCES) -> int:
+    """Html of the report, nothing is opened; size of the file in bytes"""
+    directory = path.dirname(path.abspath(file_name))
+    with profiling.stage('write_report'):
+        html = file_html(tabs, report_resources(directory, resources), title).encode('utf-8')
+        with open(file_name, 'wb') as f:
+            f.write(html)
+    profiling.count('html_bytes', len(html))
+    return len(html)
+
+
+def level_of_detail(skill, buckets: int) -> (np.ndarray, DataFrame):
+    """Fights in a row are split into buckets -> positions of the fights with the lowest and the highest skill
+    of every bucket and the buckets: x (middle fight number), min, max and mean skill"""
+    n = len(skill)
+    fights = DataFrame({'x': np.arange(1, n + 1), 'skill': np.asarray(skill, dtype=np.float64)})
+    groups = fights.groupby(np.arange(n) * buckets // n)
+    positions = np.union1d(groups.skill.idxmin().values, groups.skill.idxmax().values)
+    lod = groups.skill.agg(['min', 'max', 'mean'])
+    lod['x'] = groups.x.mean()
+    return positions, lod
+
+
+class Report:
+    """Tabs of the report. progress(message) is called before every tab is built,
+    check_cancelled() may raise to stop between the tabs"""
+    def __init__(self, width=WIDTH, height=HEIGHT, progress=None, check_cancelled=None):
+        self.width = width
+        self.height = height
+        self.progress = progress or (lambda message: None)
+        self.check_cancelled = check_cancelled or (lambda: None)
+
+    def build(self, df: DataFrame, stats: DataFrame = None, roster: DataFrame = None) -> Tabs:
+        """stats is the rollup cube of the fights (aggregation.cube), every chart but Skill-Fights is a sum of it.
+        With the cube of the players of a Union (roster.roster_cube) the tabs of build_roster are added"""
+        df_wins_defeats = df[(df.Результат == WIN) | (df.Результат == DEFEAT)]
+        if stats is None:
+            stats = cube(df)
+        stats_wins_defeats = stats[(stats.Результат == WIN) | (stats.Результат == DEFEAT)]
+        series_date = stats_wins_defeats.Дата.dt.strftime('%Y-%m-%d')
+        tabs = []
+
+        # (title, cube, keys of the rollup, builder, arguments of the builder)
+        charts = [
+            ('Skill-Maps', stats_wins_defeats, 'Карта', self.build_hist, dict(name='Map', label_orientation=True)),
+            ('Skill-Sizes', stats_wins_defeats, 'Размер', self.build_hist, dict(name='Size')),
+            ('Skill-Sides', stats_wins_defeats, 'Сторона', self.build_hist, dict(name='Side')),
+            ('Skill-Dates', stats_wins_defeats, series_date, self.build_hist,
+             dict(name='Date', visible_xaxis=False, visible_grid=False)),
+            ('Skill-Years', stats_wins_defeats, 'Год', self.build_hist, dict(name='Year')),
+            ('Skill-Months', stats_wins_defeats, 'Месяц', self.build_hist, dict(name='Month')),
+            ('Skill-DaysOfWeek', stats_wins_defeats, 'ДеньНедели', self.build_hist, dict(name='DayOfWeek')),
+            ('Skill-Hours', stats_wins_defeats, 'Час', self.build_hist, dict(name='Hour', visible_grid=False)),
+            ('Skill-Maps', stats_wins_defeats, ['Карта', 'Сторона'], self.build_categorical_hist,
+             dict(name='Map-Side', label_orientation=True)),
+            ('Years-Month', stats_wins_defeats, ['Год', 'Месяц'], self.heat_map, {}),
+            ('Common table', stats, 'Результат', self.common_table, {})
+        ]
+        # the rollups run concurrently, bokeh models are built after them in this thread
+        with ThreadPoolExecutor(CHART_WORKERS) as pool:
+            rollups = list(pool.map(lambda chart: timed(rollup, chart[1], chart[2]), charts))
+
+        timings = []
+        p, build_time = timed(self.build_graph_skill_fights, df_wins_defeats)
+        tabs.append(Panel(child=p, title='Skill-Fights'))
+        timings.append(('Skill-Fights', 0.0, build_time))
+        p, build_time = timed(self.build_form, df_wins_defeats)
+        if p:
+            tabs.append(Panel(child=p, title='Form'))
+        timings.append(('Form', 0.0, build_time))
+        for i, ((title, _, _, builder, kwargs), (tab_stats, rollup_time)) in enumerate(zip(charts, rollups), 3):
+            self.check_cancelled()
+            self.progress(f'Вкладок: {i} из {len(charts) + 2}')
+            p, build_time = timed(builder, tab_stats, **kwargs)
+            if p:
+                tabs.append(Panel(child=p, title=title))
+            timings.append((kwargs.get('name', title), rollup_time, build_time))
+        self.log_timings(timings)
+        if roster is not None:
+            self.check_cancelled()
+            self.progress('Сравнение игроков')
+            tabs += self.build_roster(roster)
+
+        return Tabs(tabs=tabs)
+
+    def build_roster(self, roster: DataFrame) -> [Panel]:
+        """Tabs comparing the players of a roster cube (roster.roster_cube, join_cubes): ranking table,
+        skill of every player and heat maps of player by map, side and hour. Every chart shows all the players,
+        in the order of the ranking"""
+        table = ranking(roster)
+        players = list(table.index)
+        stats_wins_defeats = roster[(roster.Результат == WIN) | (roster.Результат == DEFEAT)]
+        # (title, keys of the rollup, builder, arguments of the builder)
+        charts = [
+            ('Players', PLAYER, self.build_hist, dict(name='Player', label_orientation=True)),
+            ('Players-Maps', [PLAYER, 'Карта'], self.player_heat_map, dict(players=players, name='Map')),
+            ('Players-Sides', [PLAYER, 'Сторона'], self.player_heat_map, dict(players=players, name='Side')),
+            ('Players-Hours', [PLAYER, 'Час'], self.player_heat_map, dict(players=players, name='Hour'))
+        ]
+        with ThreadPoolExecutor(CHART_WORKERS) as pool:
+            rollups = list(pool.map(lambda chart: timed(rollup, stats_wins_defeats, chart[1]), charts))
+
+        p, build_time = timed(self.ranking_table, table)
+        tabs = [Panel(child=p, title='Ranking')]
+        timings = [('Ranking', 0.0, build_time)]
+        for (title, _, builder, kwargs), (tab_stats, rollup_time) in zip(charts, rollups):
+            if builder == self.build_hist:
+                # the bars of the players follow the ranking
+                tab_stats.index = tab_stats.index.astype(str)
+                tab_stats = tab_stats.loc[players]
+            p, build_time = timed(builder, tab_stats, **kwargs)
+            if p:
+                tabs.append(Panel(child=p, title=title))
+            timings.append((title, rollup_time, build_time))
+        self.log_timings(timings)
+        return tabs
+
+    def build_graph_skill_fights(self, df: DataFrame):
+        logger.debug('Graph skill-fights')
+        total = len(df)
+        x = np.arange(1, total + 1)
+        lod = None
+        if total > LOD_POINTS:
+            positions, lod = level_of_detail(df.Скилл.values, LOD_BUCKETS)
+            df, x = df.iloc[positions], x[positions]
+            logger.info(f'Skill-Fights: {len(df)} of {total} fights shown, {len(lod)} buckets')
+        maps, map_names = factor_codes(df.Карта)
+        sizes, size_names = factor_codes(df.Размер)
+        source = ColumnDataSource(data=self.fights_columns(df, x, maps, sizes))
+        difference_kd = source.data['difference_kd']
+
+        colors = ['#E60C00', '#E67E00', '#FFCC0F', '#B5EB00', '#78EB00', '#2BEB00']
+        color_mapper = LinearColorMapper(palette=colors,
+                                         low=min(difference_kd), high=max(difference_kd))
+
+        TOOLTIPS = [
+            ('K/D', "@kills/@deaths"),
+            ('Skill', '@y{0.0}'),
+            ('Map', '@map{custom}'),
+            ('xVSx', '@size{custom}')
+        ]
+        hover_tools = HoverTool(tooltips=TOOLTIPS,
+                                formatters=dict(map=names_formatter(map_names), size=names_formatter(size_names)),
+                                line_policy='nearest', point_policy='snap_to_data')
+
+        title = "Click on fights!"
+        if lod is not None:
+            title += f" Worst and best fight of {len(lod)} buckets: {len(df)} of {total} shown"
+        # sizing_mode='stretch_both' don't work in tabs :(
+        p = figure(title=title, x_axis_label='Fight number', y_axis_label='Skill',
+                   tools="pan,tap,wheel_zoom,reset", active_drag="pan", width=self.width, height=self.height,
+                   output_backend='webgl' if total > WEBGL_POINTS else 'canvas')
+
+        if lod is not None:
+            lod_source = ColumnDataSource(data=dict(x=lod.x.values, low=lod['min'].values, high=lod['max'].values,
+                                                    mean=lod['mean'].values))
+            p.segment('x', 'low', 'x', 'high', source=lod_source, color='#B0B0B0', line_alpha=0.5)
+            p.line('x', 'mean', source=lod_source, color='#505050', legend="Mean skill")
+        fights_renderer = p.circle('x', 'y', size=8, nonselection_fill_alpha=0.7, fill_alpha=0.7, source=source,
+                                   legend="Fights", color={'field': 'difference_kd', 'transform': color_mapper},
+                                   nonselection_color={'field': 'difference_kd', 'transform': color_mapper})
+        p.toolbar.active_scroll = p.select_one(WheelZoomTool)
+        hover_tools.renderers = [fights_renderer]
+        p.tools.append(hover_tools)
+
+        color_bar = ColorBar(color_mapper=color_mapper, major_label_text_font_size="8pt",
+                             ticker=BasicTicker(desired_num_ticks=len(colors)),
+                             formatter=PrintfTickFormatter(format='%d k/d difference'),
+                             label_standoff=21, border_line_color=None, location=(0, 0))
+        p.add_layout(color_bar, 'right')
+
+        url = 'https://fastcup.net/fight.html?id=@fights'
+        taptool = p.select(type=TapTool)
+        taptool.renderers = [fights_renderer]
+        taptool.callback = OpenURL(url=url)
+        return p
+
+    def build_form(self, df: DataFrame):
+        """Form of the fights (trends.form): rolling skill with the moving average on every map, rolling K/D and
+        win rate, streaks and the longest of them. The lines are smooth: above LOD_BUCKETS fights every n-th one
+        is drawn"""
+        logger.debug('Form')
+        if len(df) <= 1:
+            return False
+        trends = form(df)
+        step = -(-len(trends) // LOD_BUCKETS)
+        shown = trends.iloc[::step]
+        source = ColumnDataSource(data=dict(
+            x=packed(shown.fight.values),
+            skill=shown.skill.values.astype(np.float32),
+            kd=shown.kd.values.astype(np.float32),
+            win_rate=shown.win_rate.values.astype(np.float32),
+            streak=packed(shown.streak.values)
+        ))
+        backend = 'webgl' if len(shown) > WEBGL_POINTS else 'canvas'
+        height = self.height // 3
+
+        # sizing_mode='stretch_both' don't work in tabs :(
+        p_skill = figure(title=f"Skill of the last {ROLLING_FIGHTS} fights and of the last {MAP_FIGHTS} on the map",
+                         y_axis_label='Skill', tools="pan,wheel_zoom,reset", active_drag="pan",
+                         width=self.width, height=height, output_backend=backend)
+        maps, map_names = factor_codes(df.Карта)
+        colors = Category20[20]
+        for code, name in enumerate(map_names):
+            on_map = trends[maps == code].iloc[::step]
+            p_skill.line(on_map.fight.values, on_map.map_skill.values.astype(np.float32), legend=name,
+                         color=colors[code % len(colors)], line_alpha=0.6)
+        skill_renderer = p_skill.line('x', 'skill', source=source, color='#000000', line_width=2, legend='All maps')
+        p_skill.legend.click_policy = 'hide'
+        p_skill.add_tools(HoverTool(tooltips=[('Fight', '@x'), ('Skill', '@skill{0.000}')],
+                                    renderers=[skill_renderer], mode='vline'))
+
+        p_kd = figure(title=f"K/D and win rate of the last {ROLLING_FIGHTS} fights", x_range=p_skill.x_range,
+                      tools="pan,wheel_zoom,reset", active_drag="pan", width=self.width, height=height,
+                      output_backend=backend)
+        kd_renderer = p_kd.line('x', 'kd', source=source, color='#2171b5', legend='K/D')
+        p_kd.line('x', 'win_rate', source=source, color='#2BEB00', legend='Win rate')
+        p_kd.add_tools(HoverTool(tooltips=[('Fight', '@x'), ('K/D', '@kd{0.00}'), ('Win rate', '@win_rate{0%}')],
+                                 renderers=[kd_renderer], mode='vline'))
+
+        p_streak = figure(title="Streaks: wins up, defeats down", x_axis_label='Fight number',
+                          x_range=p_skill.x_range, tools="pan,wheel_zoom,reset", active_drag="pan",
+                          width=self.width, height=height, output_backend=backend)
+        streak_renderer = p_streak.step('x', 'streak', source=source, color='#505050', mode='center')
+        p_streak.add_tools(HoverTool(tooltips=[('Fight', '@x'), ('Streak', '@streak')],
+                                     renderers=[streak_renderer], mode='vline'))
+        for p in (p_skill, p_kd, p_streak):
+            p.toolbar.active_scroll = p.select_one(WheelZoomTool)
+
+        runs = longest_streaks(df, trends.streak.values)
+        table_source = ColumnDataSource(data=dict(
+            length=packed(runs.length.values),
+            first=packed(runs['first'].values),
+            last=packed(runs['last'].values),
+            start=runs['from'].values,
+            end=runs['to'].values
+        ))
+        columns = [
+            TableColumn(field="length", title="Серия (- поражения)"),
+            TableColumn(field="first", title="С боя"),
+            TableColumn(field="last", title="По бой"),
+            TableColumn(field="start", title="С даты", formatter=DateFormatter(format='%Y-%m-%d')),
+            TableColumn(field="end", title="По дату", formatter=DateFormatter(format='%Y-%m-%d'))
+        ]
+        table = DataTable(source=table_source, columns=columns, width=800, height=height)
+
+        return column(p_skill, p_kd, p_streak, table)
+
+    def build_hist(self, stats: DataFrame, name: str, visible_xaxis=True, visible_grid=True, label_orientation=False):
+        """stats of aggregation.aggregate or rollup by one key"""
+        logger.debug(f'Build hist {name}')
+        # prepare data
+        if len(stats) <= 1:
+            return False
+
+        x = self.factors(stats.index)
+        number_of_fights = stats.fights.values
+        skill_sum = stats.skill.values
+        source = self.stats_source(stats, x=x, y=skill_sum)
+
+        colors = ['#deebf7', '#c6dbef', '#9ecae1', '#6baed6', '#4292c6', '#2171b5', '#084594']
+        color_mapper = LinearColorMapper(palette=colors,
+                                         low=min(number_of_fights), high=max(number_of_fights))
+
+        TOOLTIPS = [
+            ('Skill', '@y{0.0}'),
+            ('Average skill', '@avg_skill{0.000}'),
+            ('Number of fights', '@number_of_fights'),
+            (name, '@x'),
+            ('K/D', '@kills/@deaths'),
+            ('Wins', '@wins'),
+            ('Defeats', '@defeats')
+        ]
+
+        # sizing_mode='stretch_both' don't work in tabs :(
+        p = figure(x_range=x, title="", tooltips=TOOLTIPS, tools="pan,wheel_zoom,reset", width=self.width, height=self.height,
+                   y_axis_label='Skill')
+        p.vbar(x='x', top='y', width=0.9, source=source, color={'field': 'number_of_fights', 'transform': color_mapper})
+        p.toolbar.active_scroll = p.select_one(WheelZoomTool)
+
+        min_skill_sum = min(skill_sum)
+        p.y_range.start = min_skill_sum if min_skill_sum < 0 else 0
+        if label_orientation:
+            p.xaxis.major_label_orientation = 3.14 / 3
+
+        color_bar = ColorBar(color_mapper=color_mapper, major_label_text_font_size="8pt",
+                             ticker=BasicTicker(desired_num_ticks=len(colors)),
+                             formatter=PrintfTickFormatter(format='%d fights'),
+                             label_standoff=13, border_line_color=None, location=(0, 0))
+        p.add_layout(color_bar, 'right')
+
+        if not visible_xaxis:
+            p.xaxis.major_label_text_font_size = '0pt'
+
+        if not visible_grid:
+            p.grid.grid_line_color = None
+            p.axis.major_tick_line_color = None
+
+        return p
+
+    def build_categorical_hist(self, stats: DataFrame, name: str, visible_xaxis=True,
+                               visible_grid=True, label_orientation=False):
+        """stats of aggregation.aggregate or rollup by two keys, bars are grouped by the first one"""
+        logger.debug('Categorical hist')
+        # prepare data
+        if len(stats) <= 1:
+            return False
+
+        number_of_fights = stats.fights.values
+        skill_sum = stats.skill.values
+
+        x = list(zip(*(self.factors(stats.index.get_level_values(level)) for level in range(2))))
+        source = self.stats_source(stats, x=x, y=skill_sum)
+
+        colors = ['#deebf7', '#c6dbef', '#9ecae1', '#6baed6', '#4292c6', '#2171b5', '#084594']
+        color_mapper = LinearColorMapper(palette=colors,
+                                         low=min(number_of_fights), high=max(number_of_fights))
+
+        TOOLTIPS = [
+            ('Skill', '@y{0.0}'),
+            ('Average skill', '@avg_skill{0.000}'),
+            ('Number of fights', '@number_of_fights'),
+            (name, '@x'),
+            ('K/D', '@kills/@deaths'),
+            ('Wins', '@wins'),
+            ('Defeats', '@defeats')
+        ]
+
+        # sizing_mode='stretch_both' don't work in tabs :(
+        p = figure(x_range=FactorRange(*x), title="", tooltips=TOOLTIPS, tools="pan,wheel_zoom,reset", width=self.width, height=self.height,
+                   y_axis_label='Skill')
+        p.vbar(x='x', top='y', width=0.9, source=source, color={'field': 'number_of_fights', 'transform': color_mapper})
+        p.toolbar.active_scroll = p.select_one(WheelZoomTool)
+
+        min_skill_sum = min(skill_sum)
+        p.y_range.start = min_skill_sum if min_skill_sum < 0 else 0
+        if label_orientation:
+            p.xaxis.group_label_orientation = 3.14 / 3
+
+        color_bar = ColorBar(color_mapper=color_mapper, major_label_text_font_size="8pt",
+                             ticker=BasicTicker(desired_num_ticks=len(colors)),
+                             formatter=PrintfTickFormatter(format='%d fights'),
+                             label_standoff=13, border_line_color=None, location=(0, 0))
+        p.add_layout(color_bar, 'right')
+
+        if not visible_xaxis:
+            p.xaxis.major_label_text_font_size = '0pt'
+
+        if not visible_grid:
+            p.grid.grid_line_color = None
+            p.axis.major_tick_line_color = None
+
+        return p
+
+    def heat_map(self, stats: DataFrame):
+        """stats of aggregation.aggregate or rollup by year and month"""
+        logger.debug('Heat map')
+        if len(stats) <= 1:
+            return False
+
+        months = self.factors(stats.index.get_level_values('Месяц'))
+        years = self.factors(stats.index.get_level_values('Год'))
+        number_of_fights = stats.fights.values
+        stats = stats.assign(skill=stats.skill.round(1))
+        source = self.stats_source(stats, x=months, y=years, skill_sum=stats.skill.values)
+
+        colors = ['#deebf7', '#c6dbef', '#9ecae1', '#6baed6', '#4292c6', '#2171b5', '#084594']
+        color_mapper = LinearColorMapper(palette=colors,
+                                         low=min(number_of_fights), high=max(number_of_fights))
+        colors_skill = ['#000000', '#FFFFFF']
+        color_mapper_skill = LinearColorMapper(palette=colors_skill,
+                                               low=min(number_of_fights), high=max(number_of_fights))
+        colors_wins = ['#002d00', '#00ea00']
+        color_mapper_wins = LinearColorMapper(palette=colors_wins,
+                                              low=min(number_of_fights), high=max(number_of_fights))
+        colors_defeats = ['#380000', '#e30000', '#ff2435']
+        color_mapper_defeats = LinearColorMapper(palette=colors_defeats,
+                                                 low=min(number_of_fights), high=max(number_of_fights))
+
+        TOOLTIPS = [
+            ('Skill', '@skill_sum{0.0}'),
+            ('Average skill', '@avg_skill{0.000}'),
+            ('Number of fights', '@number_of_fights'),
+            ('Year', '@y'),
+            ('Month', '@x'),
+            ('K/D', '@kills/@deaths'),
+            ('Wins', '@wins'),
+            ('Defeats', '@defeats')
+        ]
+        hover_tools = HoverTool(tooltips=TOOLTIPS, line_policy='nearest', point_policy='snap_to_data', names=['rect'])
+
+        p = figure(title="",
+                   x_range=['01', '02', '03', '04', '05', '06',
+                            '07', '08', '09', '10', '11', '12'],
+                   y_range=sorted(set(years)),
+                   x_axis_location="above", plot_width=self.width, plot_height=self.height,
+                   tools="pan,box_zoom,reset,wheel_zoom")
+
+        p.rect(x="x", y="y", width=1, height=1,
+               source=source,
+               fill_color={'field': 'number_of_fights', 'transform': color_mapper},
+               line_color='#deebf7',
+               name='rect')
+        p.tools.append(hover_tools)
+
+        text_props = {"source": source, "text_font_size": '8pt', "x_offset": -0.8}
+
+        x = dodge("x", -0.4, range=p.x_range)
+        p.text(x=x, y=dodge("y", 0.2, range=p.y_range), text="skill_sum",
+               text_color={'field': 'number_of_fights', 'transform': color_mapper_skill}, **text_props)
+        p.text(x=x, y=dodge("y", -0.1, range=p.y_range), text="wins",
+               text_color={'field': 'number_of_fights', 'transform': color_mapper_wins}, **text_props)
+        p.text(x=x, y=dodge("y", -0.25, range=p.y_range), text="defeats",
+               text_color={'field': 'number_of_fights', 'transform': color_mapper_defeats}, **text_props)
+
+        p.grid.grid_line_color = None
+        p.axis.axis_line_color = None
+        p.axis.major_tick_line_color = None
+        p.axis.major_label_text_font_size = "8pt"
+        p.axis.major_label_standoff = 0
+        # p.xaxis.major_label_orientation = pi / 3
+
+        color_bar = ColorBar(color_mapper=color_mapper, major_label_text_font_size="8pt",
+                             ticker=BasicTicker(desired_num_ticks=len(colors)),
+                             formatter=PrintfTickFormatter(format='%d fights'),
+                             label_standoff=13, border_line_color=None, location=(0, 0))
+        p.add_layout(color_bar, 'right')
+
+        return p
+
+    def player_heat_map(self, stats: DataFrame, players: [str], name: str):
+        """stats of a rollup by player and one more key: average skill of every player (rows, the first player on top)
+        and key (columns)"""
+        logger.debug(f'Player heat map {name}')
+        if not len(stats):
+            return False
+        x = self.factors(stats.index.get_level_values(1))
+        y = [str(player) for player in stats.index.get_level_values(0)]
+        source = self.stats_source(stats, x=x, y=y)
+        avg_skill = source.data['avg_skill']
+
+        # red below zero, green above
+        limit = max(abs(avg_skill.min()), abs(avg_skill.max())) or 1
+        colors = list(reversed(RdYlGn[11]))
+        color_mapper = LinearColorMapper(palette=colors, low=-limit, high=limit)
+
+        TOOLTIPS = [
+            ('Player', '@y'),
+            (name, '@x'),
+            ('Average skill', '@avg_skill{0.000}'),
+            ('Number of fights', '@number_of_fights'),
+            ('K/D', '@kills/@deaths'),
+            ('Wins', '@wins'),
+            ('Defeats', '@defeats')
+        ]
+
+        # a row of at least 16 pixels for every player
+        p = figure(title="", x_range=sorted(set(x)), y_range=list(reversed(players)), x_axis_location="above",
+                   tooltips=TOOLTIPS, tools="pan,wheel_zoom,reset", width=self.width,
+                   height=max(self.height, 16 * len(players) + 100))
+        p.rect(x='x', y='y', width=1, height=1, source=source, line_color='#deebf7',
+               fill_color={'field': 'avg_skill', 'transform': color_mapper})
+        p.toolbar.active_scroll = p.select_one(WheelZoomTool)
+
+        p.grid.grid_line_color = None
+        p.axis.axis_line_color = None
+        p.axis.major_tick_line_color = None
+        p.axis.major_label_text_font_size = "8pt"
+        if name == 'Map':
+            p.xaxis.major_label_orientation = 3.14 / 3
+
+        color_bar = ColorBar(color_mapper=color_mapper, major_label_text_font_size="8pt",
+                             ticker=BasicTicker(desired_num_ticks=len(colors)),
+                             formatter=PrintfTickFormatter(format='%.1f avg skill'),
+                             label_standoff=13, border_line_color=None, location=(0, 0))
+        p.add_layout(color_bar, 'right')
+
+        return p
+
+    @staticmethod
+    def ranking_table(table: DataFrame):
+        """Players of roster.ranking, the columns can be sorted by a click"""
+        logger.debug('Ranking table')
+        source = ColumnDataSource(data=dict(
+            place=[str(place) if place else '' for place in table.place],
+            player=list(table.index),
+            fights=packed(table.fights.values),
+            wins=packed(table.wins.values),
+            defeats=packed(table.defeats.values),
+            win_rate=table.win_rate.values,
+            skill=table.skill.values,
+            avg_skill=table.avg_skill.values,
+            kd=table.kd.values
+        ))
+        columns = [
+            TableColumn(field="place", title="Место"),
+            TableColumn(field="player", title="Игрок"),
+            TableColumn(field="fights", title="Боёв"),
+            TableColumn(field="wins", title="Побед"),
+            TableColumn(field="defeats", title="Поражений"),
+            TableColumn(field="win_rate", title="Доля побед", formatter=NumberFormatter(format="0.0%")),
+            TableColumn(field="skill", title="Суммарный скилл", formatter=NumberFormatter(format="0.0")),
+            TableColumn(field="avg_skill", title="Средний скилл", formatter=NumberFormatter(format="0.000")),
+            TableColumn(field="kd", title="K/D", formatter=NumberFormatter(format="0.00"))
+        ]
+
+        return DataTable(source=source, columns=columns, width=1000, height=25 * len(table) + 30)
+
+    @staticmethod
+    def common_table(stats: DataFrame):
+        """stats of aggregation.aggregate or rollup by result"""
+        logger.debug('Common table')
+        source = ColumnDataSource(data=Report.table_columns(stats))
+        columns = [
+            TableColumn(field="y", title="Результат"),
+            TableColumn(field="fights_count", title="Количество"),
+            TableColumn(field="skill_sum", title="Суммарный скилл", formatter=NumberFormatter(format="0.0"))
+        ]
+
+        data_table = DataTable(source=source, columns=columns, width=800)
+
+        return data_table
+
+    @staticmethod
+    def fights_columns(df: DataFrame, x, maps, sizes) -> dict:
+        """Columns of the Skill-Fights source: fight numbers x and the codes of factor_codes for maps and sizes"""
+        return dict(
+            x=packed(x),
+            y=df.Скилл.values.astype(np.float32),
+            fights=fight_ids(df.Игра),
+            kills=packed(df.Фраги.values),
+            deaths=packed(df.Смерти.values),
+            map=maps,
+            size=sizes,
+            difference_kd=packed(df.Фраги.values.astype(np.int64) - df.Смерти.values)
+        )
+
+    @staticmethod
+    def table_columns(stats: DataFrame) -> dict:
+        return dict(
+            y=[str(result) for result in stats.index],
+            fights_count=packed(stats.fights.values),
+            skill_sum=stats.skill.values
+        )
+
+    @staticmethod
+    def stats_columns(stats: DataFrame, **columns) -> dict:
+        """Columns of a rollup chart: the columns of its glyphs and the sums of the tooltips"""
+        return dict(
+            number_of_fights=packed(stats.fights.values),
+            avg_skill=stats.skill.values / stats.fights.values,
+            kills=packed(stats.kills.values),
+            deaths=packed(stats.deaths.values),
+            wins=packed(stats.wins.values),
+            defeats=packed(stats.defeats.values),
+            **columns
+        )
+
+    @classmethod
+    def stats_source(cls, stats: DataFrame, **columns) -> ColumnDataSource:
+        """Source of a rollup chart, see stats_columns"""
+        return ColumnDataSource(data=cls.stats_columns(stats, **columns))
+
+    @staticmethod
+    def log_timings(timings: [tuple]):
+        """timings: (tab, rollup seconds, build seconds), the slowest tabs first"""
+        for tab, rollup_time, build_time in sorted(timings, key=lambda t: t[1] + t[2], reverse=True):
+            logger.info(f'Tab {tab}: rollup {rollup_time:.3f} s, build {build_time:.3f} s')
+            profiling.record(f'rollup {tab}', rollup_time)
+            profiling.record(f'chart {tab}', build_time)
+        logger.info(f'Tabs: {len(timings)}, total {sum(t[1] + t[2] for t in timings):.3f} s')
+
+    @staticmethod
+    def factors(values) -> [str]:
+        """Bokeh categories are strings: integer date parts become '2019', '03', '07', days of the week '1'..'7'.
+        values is an index (level), its name is the column"""
+        fmt = FACTOR_FORMATS.get(getattr(values, 'name', None), '%02d')
+        return [str(value) if isinstance(value, str) else fmt % value for value in values]
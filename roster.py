@@ -0,0 +1,62 @@
+"""Comparison of the players of a roster: the fights of all of them are rolled up into one cube keyed by
+the player, so the charts show every player at once instead of a report per player"""
+import numpy as np
+from pandas import DataFrame, Series, concat
+
+from aggregation import WIN, DEFEAT, GRAIN, STATS, aggregate, add_date_parts, rollup
+
+# --------------------- CONFIG ---------------------
+# players with fewer wins and defeats are in the ranking table without a place
+MIN_FIGHTS = 50
+
+# --------------------------------------------------
+
+# key of the roster cube
+PLAYER = "Игрок"
+# columns of ranking
+RANKING = ['place', 'fights', 'wins', 'defeats', 'win_rate', 'skill', 'avg_skill', 'kd']
+
+
+def roster_cube(df: DataFrame, players) -> DataFrame:
+    """Stats of the fights of all the players by player and GRAIN in one groupby pass, like aggregation.cube.
+    players: the column of df with the player of every fight (loader.SOURCE of a Union)"""
+    player = Series(df[players] if isinstance(players, str) else players, index=df.index, name=PLAYER)
+    return add_date_parts(aggregate(df, [player] + GRAIN).reset_index())
+
+
+def join_cubes(cubes: dict) -> DataFrame:
+    """Roster cube of the cubes of single players, {player: aggregation.cube}"""
+    cubes = {name: stats for name, stats in cubes.items() if stats is not None and len(stats)}
+    if not cubes:
+        raise ValueError('No players')
+    roster = concat([stats.assign(**{PLAYER: name})[[PLAYER] + GRAIN + STATS] for name, stats in cubes.items()],
+                    ignore_index=True, sort=False)
+    # the categories of every player are different
+    for key in (PLAYER, 'Карта', 'Сторона', 'Размер', 'Результат'):
+        roster[key] = roster[key].astype(str).astype('category')
+    return add_date_parts(roster)
+
+
+def wins_defeats(cube: DataFrame) -> DataFrame:
+    return cube[(cube.Результат == WIN) | (cube.Результат == DEFEAT)]
+
+
+def ranking(cube: DataFrame, min_fights: int = MIN_FIGHTS) -> DataFrame:
+    """Players of the roster cube by average skill of their wins and defeats, the best first.
+    Players with fewer than min_fights fights follow them without a place"""
+    stats = rollup(wins_defeats(cube), PLAYER)
+    stats.index = stats.index.astype(str)
+    table = DataFrame({
+        'fights': stats.fights,
+        'wins': stats.wins,
+        'defeats': stats.defeats,
+        'win_rate': stats.wins / stats.fights,
+        'skill': stats.skill,
+        'avg_skill': stats.skill / stats.fights,
+        'kd': stats.kills / np.maximum(stats.deaths, 1)
+    }, index=stats.index)
+    ranked = table.fights >= min_fights
+    table = concat([table[ranked].sort_values('avg_skill', ascending=False, kind='mergesort'),
+                    table[~ranked].sort_values('fights', ascending=False, kind='mergesort')], sort=False)
+    table.insert(0, 'place', np.where(np.arange(len(table)) < ranked.sum(), np.arange(1, len(table) + 1), 0))
+    return table[RANKING]
@@ -0,0 +1,233 @@
+import logging
+import sqlite3
+from os import path, makedirs
+
+from pandas import DataFrame, read_sql_query, to_datetime, to_numeric
+
+from aggregation import GRAIN, STATS, WIN, DEFEAT, add_date_parts, cube
+from parsing import LABELS
+from schema import INTEGERS, apply_schema
+
+# --------------------- CONFIG ---------------------
+STORE_DIRECTORY = 'data'
+STORE_FILE = 'fights.sqlite'
+# seconds to wait for another process writing the store (batch.py workers)
+STORE_TIMEOUT = 60
+
+# --------------------------------------------------
+
+logger = logging.getLogger("log")
+
+# text columns of parsing.parse_fights are kept as codes of the labels table
+CODED_COLUMNS = {'channel': 'Канал', 'size': 'Размер', 'map': 'Карта', 'side': 'Сторона', 'result': 'Результат',
+                 'sep': 'Деление'}
+# label columns of the rollup cube (aggregation.GRAIN without the day and the hour)
+CUBE_COLUMNS = {name: column for name, column in CODED_COLUMNS.items() if column in GRAIN}
+PADDED = {i: '%02d' % i for i in range(60)}
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS labels (
+    id INTEGER PRIMARY KEY,
+    value TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS fights (
+    player INTEGER NOT NULL,
+    fight INTEGER NOT NULL,
+    day INTEGER NOT NULL,     -- days since 1970-01-01
+    minute INTEGER NOT NULL,  -- minutes since midnight
+    channel INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    map INTEGER NOT NULL,
+    side INTEGER NOT NULL,
+    result INTEGER NOT NULL,
+    kills INTEGER NOT NULL,
+    deaths INTEGER NOT NULL,
+    skill REAL NOT NULL,
+    sep INTEGER NOT NULL,
+    exp INTEGER NOT NULL,
+    PRIMARY KEY (player, fight)
+) WITHOUT ROWID;
+-- aggregation.cube of the fights of every player, updated on insert
+CREATE TABLE IF NOT EXISTS rollup (
+    player INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    hour INTEGER NOT NULL,
+    map INTEGER NOT NULL,
+    side INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    result INTEGER NOT NULL,
+    skill REAL NOT NULL DEFAULT 0,
+    fights INTEGER NOT NULL DEFAULT 0,
+    kills INTEGER NOT NULL DEFAULT 0,
+    deaths INTEGER NOT NULL DEFAULT 0,
+    wins INTEGER NOT NULL DEFAULT 0,
+    defeats INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (player, day, hour, map, side, size, result)
+) WITHOUT ROWID;
+"""
+CUBE_KEYS = ['player', 'day', 'hour'] + list(CUBE_COLUMNS)
+
+
+class FightStore:
+    """Parsed fights of all players in one sqlite file, keyed by (player, fight id)"""
+    def __init__(self, file_name=path.join(STORE_DIRECTORY, STORE_FILE)):
+        self.file_name = file_name
+        directory = path.dirname(file_name)
+        if directory and not path.exists(directory):
+            makedirs(directory)
+        self.connection = sqlite3.connect(file_name, timeout=STORE_TIMEOUT)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def players(self) -> [str]:
+        return [row[0] for row in self.connection.execute("SELECT name FROM players ORDER BY name")]
+
+    def newest_fight_id(self, player_name: str):
+        return self.connection.execute("SELECT max(fight) FROM fights JOIN players ON player = id WHERE name = ?",
+                                       (player_name,)).fetchone()[0]
+
+    def _ids(self, table: str, column: str, values) -> dict:
+        self.connection.executemany(f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)",
+                                    ((value,) for value in set(values)))
+        return {value: id_ for id_, value in self.connection.execute(f"SELECT id, {column} FROM {table}")}
+
+    def insert(self, player_name: str, df: DataFrame) -> int:
+        """Add fights of parsing.parse_fights, already known fight ids are skipped.
+        The new fights are added to the rollup cube of the player"""
+        with self.connection:
+            player = self._ids('players', 'name', [player_name])[player_name]
+            total = len(df)
+            # the first of the same fight in df, like INSERT OR IGNORE, so the cube counts it once
+            df = df.drop_duplicates('Игра')
+            fights = [int(fight[1:]) for fight in df.Игра]
+            known = {row[0] for row in self.connection.execute("SELECT fight FROM fights WHERE player = ?", (player,))}
+            if known:
+                new = [fight not in known for fight in fights]
+                df = df[new]
+                fights = [fight for fight, is_new in zip(fights, new) if is_new]
+            labels = self._ids('labels', 'value', (value for column in CODED_COLUMNS.values() for value in df[column]))
+            rows = DataFrame({
+                'player': player,
+                'fight': fights,
+                'day': (df.Дата - to_datetime('1970-01-01')).dt.days,
+                'minute': df.Час.astype(int) * 60 + df.Минуты,
+                **{name: df[column].astype(object).map(labels) for name, column in CODED_COLUMNS.items()},
+                'kills': df.Фраги.astype(int),
+                'deaths': df.Смерти.astype(int),
+                'skill': df.Скилл,
+                'exp': df.Опыт.astype(int)
+            })
+            # a store written before the rollup table: the cube of the known fights first, the new ones are added to it
+            if known and len(rows) and self.connection.execute("SELECT 1 FROM rollup WHERE player = ? LIMIT 1",
+                                                               (player,)).fetchone() is None:
+                self._rebuild_rollup(player)
+            query = 'INSERT OR IGNORE INTO fights (%s) VALUES (%s)' % (
+                ", ".join(rows.columns), ", ".join("?" * len(rows.columns)))
+            before = self.connection.total_changes
+            self.connection.executemany(query, rows.itertuples(index=False, name=None))
+            inserted = self.connection.total_changes - before
+            if inserted:
+                self._add_to_rollup(player, cube(df), labels)
+        logger.info(f'Player: {player_name}, new fights in store: {inserted} of {total}')
+        return inserted
+
+    def _add_to_rollup(self, player: int, stats: DataFrame, labels: dict):
+        """Add a cube of new fights to the stored one cell by cell"""
+        rows = DataFrame({
+            'player': player,
+            'day': (stats.Дата - to_datetime('1970-01-01')).dt.days,
+            'hour': stats.Час.astype(int),
+            **{name: stats[column].astype(object).map(labels) for name, column in CUBE_COLUMNS.items()},
+            **{name: stats[name] for name in STATS}
+        }, columns=CUBE_KEYS + STATS)
+        self.connection.executemany(
+            'INSERT OR IGNORE INTO rollup (%s) VALUES (%s)' % (", ".join(CUBE_KEYS), ", ".join("?" * len(CUBE_KEYS))),
+            rows[CUBE_KEYS].itertuples(index=False, name=None))
+        self.connection.executemany(
+            'UPDATE rollup SET %s WHERE %s' % (", ".join(f'{name} = {name} + ?' for name in STATS),
+                                               " AND ".join(f'{name} = ?' for name in CUBE_KEYS)),
+            rows[STATS + CUBE_KEYS].itertuples(index=False, name=None))
+
+    def _rebuild_rollup(self, player: int):
+        """Cube of all the fights of a player, for stores written before the rollup table.
+        Runs in the transaction of the caller"""
+        logger.info(f'Rebuild rollup of player {player}')
+        self.connection.execute("DELETE FROM rollup WHERE player = ?", (player,))
+        self.connection.execute(
+            f"""INSERT INTO rollup ({", ".join(CUBE_KEYS + STATS)})
+            SELECT player, day, minute / 60, {", ".join(CUBE_COLUMNS)},
+                   sum(skill), count(*), sum(kills), sum(deaths),
+                   coalesce(sum(result = (SELECT id FROM labels WHERE value = ?)), 0),
+                   coalesce(sum(result = (SELECT id FROM labels WHERE value = ?)), 0)
+            FROM fights WHERE player = ? GROUP BY player, day, minute / 60, {", ".join(CUBE_COLUMNS)}""",
+            (WIN, DEFEAT, player))
+
+    def load_cube(self, players: [str] = None) -> DataFrame:
+        """Rollup cube of the players, same frame as aggregation.cube of their fights"""
+        query = ("SELECT id FROM players "
+                 "WHERE id IN (SELECT player FROM fights) AND id NOT IN (SELECT player FROM rollup)")
+        for (player,) in self.connection.execute(query).fetchall():
+            with self.connection:
+                self._rebuild_rollup(player)
+        query = "SELECT rollup.* FROM rollup JOIN players ON player = players.id"
+        params = ()
+        if players:
+            query += " WHERE name IN (%s)" % ", ".join("?" * len(players))
+            params = tuple(players)
+        rows = read_sql_query(query + " ORDER BY day", self.connection, params=params)
+        labels = dict(self.connection.execute("SELECT id, value FROM labels"))
+
+        stats = DataFrame({
+            "Дата": to_datetime(rows.day, unit='D'),
+            "Час": rows.hour.astype(INTEGERS['Час']),
+            **{column: rows[name].map(labels).astype('category') for name, column in CUBE_COLUMNS.items()},
+            **{name: rows[name] for name in STATS}
+        }, columns=GRAIN + STATS)
+        return add_date_parts(stats)
+
+    def load(self, players: [str] = None, player_column: str = None) -> DataFrame:
+        """Same frame as parsing.parse_fights, without parsing the text, with player_column the name of the player
+        of every fight in it. Stores of the older layout have NULL kills/deaths and text experience,
+        they become 0 and integers"""
+        query = "SELECT fights.*, players.name AS player_name FROM fights JOIN players ON player = players.id"
+        params = ()
+        if players:
+            query += " WHERE name IN (%s)" % ", ".join("?" * len(players))
+            params = tuple(players)
+        rows = read_sql_query(query + " ORDER BY day, fight", self.connection, params=params)
+        labels = dict(self.connection.execute("SELECT id, value FROM labels"))
+
+        date = to_datetime(rows.day, unit='D')
+        hour = rows.minute // 60
+        minutes = rows.minute % 60
+        df = DataFrame({
+            "Игра": '#' + rows.fight.astype(str),
+            "Дата": date,
+            "Время": hour.map(PADDED) + ':' + minutes.map(PADDED),
+            "Год": date.dt.year,
+            "Месяц": date.dt.month,
+            "День": date.dt.day,
+            "Час": hour,
+            "Минуты": minutes,
+            **{column: rows[name].map(labels) for name, column in CODED_COLUMNS.items()},
+            "Фраги": rows.kills.fillna(0),
+            "Смерти": rows.deaths.fillna(0),
+            "Скилл": rows.skill,
+            "Опыт": to_numeric(rows.exp, errors='coerce').fillna(0),
+            "ДеньНедели": date.dt.dayofweek + 1
+        }, columns=LABELS + ["ДеньНедели"])
+        df = apply_schema(df)
+        if player_column:
+            df[player_column] = rows.player_name.astype('category')
+        return df
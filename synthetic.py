@@ -0,0 +1,66 @@
+"""Synthetic fastcup battle histories in the text format of the saved stats files"""
+import random
+from datetime import datetime, timedelta
+
+from parsing import MONTH_TO_NUM
+
+MONTHS = list(MONTH_TO_NUM)
+MAPS = ['de_dust2', 'de_inferno', 'de_nuke', 'de_train', 'de_tuscan', 'de_mirage', 'cs_assault', 'aim_map']
+SIZES = ['1 vs 1', '2 vs 2', '3 vs 3', '5 vs 5']
+CHANNELS = ['CS 1.6 Classic Mix', 'CS 1.6 Public Cup', 'CS 1.6 Classic Duel']
+
+
+def fight_line(fight: int, when: str, rnd: random.Random) -> str:
+    result = rnd.random()
+    if result < 0.03:
+        tail = 'Не состоялся'
+    elif result < 0.05:
+        tail = 'Ошибка'
+    else:
+        kd = '%d/%d' % (rnd.randrange(40), rnd.randrange(40)) if rnd.random() > 0.02 else '-/-'
+        tail = '%s %s' % (rnd.choice(['Победа', 'Поражение', 'Победа', 'Поражение', 'Ничья']), kd)
+        extra = rnd.random()
+        if extra > 0.04:
+            tail += ' %.1f' % rnd.uniform(-10, 10)
+            if extra < 0.3:
+                tail += ' (x%d) %d' % (rnd.randrange(1, 4), rnd.randrange(500))
+            elif extra < 0.33:
+                tail += ' (x%d)' % rnd.randrange(1, 4)
+            elif extra < 0.8:
+                tail += ' %d' % rnd.randrange(500)
+    return '#%d %s %s %s %s %s %s' % (fight, when, rnd.choice(CHANNELS), rnd.choice(SIZES), rnd.choice(MAPS),
+                                      rnd.choice('AB'), tail)
+
+
+def generate_lines(fights: int, seed: int = 0, now: datetime = None) -> [str]:
+    """Newest first, like the pages of a player: every line variant data_preparation handles - relative dates
+    ("N мин назад", "N час назад", Сегодня, Вчера, Позавчера), absolute dates, "Не ...", "Ошибка", "-/-",
+    separator "(...)" with and without experience, missing skill"""
+    rnd = random.Random(seed)
+    now = now or datetime(2019, 3, 1, 12, 0)
+    when = now
+    lines = []
+    for i in range(fights):
+        when -= timedelta(minutes=rnd.randrange(5, 600))
+        ago = now - when
+        if ago < timedelta(hours=1):
+            date = '%d мин назад %s' % (ago.seconds // 60, when.strftime('%H:%M'))
+        elif ago < timedelta(hours=5):
+            date = '%d час назад %s' % (ago.seconds // 3600, when.strftime('%H:%M'))
+        elif (now.date() - when.date()).days <= 2:
+            date = '%s %s' % (['Сегодня', 'Вчера', 'Позавчера'][(now.date() - when.date()).days],
+                              when.strftime('%H:%M'))
+        else:
+            date = '%d %s %d %s' % (when.day, MONTHS[when.month - 1], when.year, when.strftime('%H:%M'))
+        lines.append(fight_line(10 ** 7 + fights - i, date, rnd))
+    return lines
+
+
+def new_fight_lines(newest: int, fights: int, rnd: random.Random, now: datetime = None) -> [str]:
+    """Fights played just now after the fight id newest, newest first like generate_lines"""
+    when = (now or datetime.today()).strftime('%H:%M')
+    return [fight_line(newest + fights - i, 'Сегодня ' + when, rnd) for i in range(fights)]
+
+
+def generate_text(fights: int, seed: int = 0, now: datetime = None) -> str:
+    return "\n".join(generate_lines(fights, seed, now))
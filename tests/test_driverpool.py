@@ -0,0 +1,101 @@
+"""DriverPool with fake browser sessions: reuse, recycling after max_uses, broken and unhealthy sessions,
+the size limit and close
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from driverpool import DriverPool, PoolTimeout
+
+
+class FakeDriver:
+    def __init__(self):
+        self.quit_called = False
+        self.healthy = True
+
+    @property
+    def current_url(self):
+        if not self.healthy:
+            raise ConnectionError('browser is gone')
+        return 'about:blank'
+
+    def quit(self):
+        self.quit_called = True
+
+
+class DriverPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.started = []
+
+    def factory(self) -> FakeDriver:
+        driver = FakeDriver()
+        self.started.append(driver)
+        return driver
+
+    def test_reuse(self):
+        pool = DriverPool(self.factory, size=2)
+        for _ in range(3):
+            with pool.session():
+                pass
+        self.assertEqual(1, len(self.started))
+        self.assertFalse(self.started[0].quit_called)
+
+    def test_recycle_after_max_uses(self):
+        pool = DriverPool(self.factory, size=1, max_uses=2)
+        for _ in range(3):
+            with pool.session():
+                pass
+        self.assertEqual(2, len(self.started))
+        self.assertTrue(self.started[0].quit_called)
+
+    def test_broken_session(self):
+        pool = DriverPool(self.factory, size=1)
+        with self.assertRaises(RuntimeError):
+            with pool.session():
+                raise RuntimeError
+        self.assertTrue(self.started[0].quit_called)
+        # an expected exception keeps the session
+        with self.assertRaises(KeyError):
+            with pool.session(expected=KeyError):
+                raise KeyError
+        with pool.session() as driver:
+            self.assertIs(self.started[1], driver)
+
+    def test_unhealthy_session(self):
+        pool = DriverPool(self.factory, size=1)
+        with pool.session() as driver:
+            pass
+        driver.healthy = False
+        with pool.session() as fresh:
+            self.assertIsNot(driver, fresh)
+        self.assertTrue(driver.quit_called)
+
+    def test_size(self):
+        pool = DriverPool(self.factory, size=1)
+        driver = pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(timeout=0.05)
+        threading.Timer(0.05, pool.release, (driver,)).start()
+        self.assertIs(driver, pool.acquire(timeout=5))
+        self.assertEqual(1, len(self.started))
+
+    def test_close(self):
+        pool = DriverPool(self.factory, size=2)
+        idle, busy = pool.acquire(), pool.acquire()
+        pool.release(idle)
+        pool.close()
+        self.assertTrue(idle.quit_called)
+        self.assertFalse(busy.quit_called)
+        pool.release(busy)
+        self.assertTrue(busy.quit_called)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""HttpFetcher against fixture_server.py: search, pagination, the pagination guard, incremental collection
+and the back-off on "429 Too Many Requests"
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fixture_server
+from fetcher import FetchError, HttpFetcher, PlayerNotFoundError
+from fight_lines import fight_id
+from fixture_server import FixtureServer
+from ratelimit import AdaptiveRateLimiter
+from synthetic import generate_lines
+
+FIGHTS = 95
+PAGE_SIZE = 20
+
+
+class HttpFetcherTest(unittest.TestCase):
+    def setUp(self):
+        self.lines = generate_lines(FIGHTS)
+        self.server = FixtureServer({'nick': list(self.lines), 'other': generate_lines(5, 1)},
+                                    page_size=PAGE_SIZE).start()
+        self.addCleanup(self.server.stop)
+
+    def fetcher(self, **kwargs) -> HttpFetcher:
+        kwargs.setdefault('limiter', AdaptiveRateLimiter(rate=100, burst=100))
+        fetcher = HttpFetcher(self.server.url, **kwargs)
+        self.addCleanup(fetcher.close)
+        return fetcher
+
+    def test_find_player(self):
+        fetcher = self.fetcher()
+        self.assertEqual(self.server.url + '/id1', fetcher.find_player('other'))
+        with self.assertRaises(PlayerNotFoundError):
+            fetcher.find_player('nobody')
+
+    def test_pages(self):
+        progress = []
+        fetcher = self.fetcher(progress=lambda fetched, pages: progress.append((fetched, pages)))
+        data = fetcher.data_collection(fetcher.find_player('nick'))
+        self.assertEqual([PAGE_SIZE] * 4 + [FIGHTS % PAGE_SIZE], [len(page) for page in data])
+        self.assertEqual(self.lines, [line for page in data for line in page])
+        self.assertEqual((5, 5), progress[-1])
+
+    def test_incremental(self):
+        fetcher = self.fetcher()
+        # the newest saved fight is on the second page, the third is the first page without new fights
+        newest = fight_id(self.lines[PAGE_SIZE + 5])
+        data = fetcher.data_collection(fetcher.find_player('nick'), newest)
+        self.assertEqual(self.lines[:3 * PAGE_SIZE], [line for page in data for line in page])
+
+    def test_pagination_guard(self):
+        render_battles = fixture_server.render_battles
+        # a site that ignores ?page= serves the first page every time
+        with mock.patch.object(fixture_server, 'render_battles',
+                               lambda lines, page, page_size: render_battles(lines, 1, page_size)):
+            fetcher = self.fetcher()
+            with self.assertRaisesRegex(FetchError, 'not paginating'):
+                fetcher.data_collection(fetcher.find_player('nick'))
+
+    def test_too_many_requests(self):
+        self.server.throttle_every = 3
+        limiter = AdaptiveRateLimiter(rate=100, burst=100)
+        fetcher = self.fetcher(limiter=limiter)
+        data = fetcher.data_collection(fetcher.find_player('nick'))
+        self.assertEqual(self.lines, [line for page in data for line in page])
+        self.assertGreater(limiter.throttled, 0)
+        self.assertLess(limiter.rate, 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
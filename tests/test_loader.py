@@ -0,0 +1,61 @@
+"""load_files of several stats text files: fights found in more than one file
+
+    python -m unittest discover tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loader import SOURCE, load_files
+
+PLAYED = '#1000013 26 февраля 2019 20:15 CS 1.6 Classic Mix 5 vs 5 de_tuscan B Победа 25/3 9.9 (x3) 480'
+CANCELLED = '#1000015 28 февраля 2019 01:00 CS 1.6 Public Cup 5 vs 5 de_mirage B Не состоялся'
+
+
+class LoadFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name: str, lines: [str]) -> str:
+        file_name = os.path.join(self.directory, name)
+        with open(file_name, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines))
+        return file_name
+
+    def load(self, *files):
+        df, stats = load_files(list(files), workers=1)
+        self.assertEqual(len(df), stats.fights.sum())
+        return df
+
+    def test_teammates_keep_a_cancelled_fight(self):
+        df = self.load(self.write('Fights_alice.txt', [CANCELLED]), self.write('Fights_bob.txt', [CANCELLED]))
+        self.assertEqual(['alice', 'bob'], sorted(df[SOURCE]))
+
+    def test_teammates_with_other_stats(self):
+        teammate = PLAYED.replace('25/3 9.9', '7/11 -2.3')
+        df = self.load(self.write('Fights_alice.txt', [PLAYED]), self.write('Fights_bob.txt', [teammate]))
+        self.assertEqual(2, len(df))
+
+    def test_overlapping_dumps(self):
+        df = self.load(self.write('Fights_a.txt', [CANCELLED, PLAYED]), self.write('Fights_b.txt', [PLAYED]))
+        self.assertEqual(['#1000013', '#1000015'], sorted(df.Игра))
+        # one player, named by the first file
+        self.assertEqual(['a', 'a'], list(df[SOURCE]))
+
+    def test_overlapping_dumps_are_one_player(self):
+        newer = PLAYED.replace('#1000013 26', '#1000014 27')
+        df = self.load(self.write('Fights_a.txt', [PLAYED]), self.write('Fights_bob.txt', [CANCELLED]),
+                       self.write('Fights_b.txt', [newer, PLAYED]))
+        self.assertEqual(3, len(df))
+        self.assertEqual({'a': 2, 'bob': 1}, df[SOURCE].value_counts().to_dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
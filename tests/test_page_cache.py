@@ -0,0 +1,125 @@
+"""PageCache: TTL of the live and the historic pages, head invalidation, LRU eviction, per-collection counters,
+and an incremental HttpFetcher collection through it against fixture_server.py
+
+    python -m unittest discover tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import page_cache
+from fetcher import HttpFetcher
+from fight_lines import fight_id
+from fixture_server import FixtureServer
+from page_cache import PageCache
+from ratelimit import AdaptiveRateLimiter
+from synthetic import generate_lines
+
+PLAYER = 'http://fastcup/id1'
+HEAD = ['1 2 3', 'Игра Дата', '#1000020 Сегодня 11:53 CS 1.6 Classic Mix 5 vs 5 de_dust2 A Победа 12/7 3.4']
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class PageCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.clock = Clock()
+        patch = mock.patch.object(page_cache, 'time', self.clock)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def cache(self, **kwargs) -> PageCache:
+        cache = PageCache(os.path.join(self.directory, 'pages.sqlite'), **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_live_page_ttl(self):
+        cache = self.cache(live_ttl=60)
+        cache.put(PLAYER, 1, HEAD, page_cache.page_head(HEAD))
+        self.clock.now += 60
+        self.assertEqual(HEAD, cache.get(PLAYER, 1))
+        self.clock.now += 1
+        self.assertIsNone(cache.get(PLAYER, 1))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_history_page_head(self):
+        cache = self.cache(history_ttl=100)
+        cache.put(PLAYER, 2, HEAD, 1000020)
+        self.assertEqual(HEAD, cache.get(PLAYER, 2, 1000020))
+        # a new fight shifts every page of the player
+        self.assertIsNone(cache.get(PLAYER, 2, 1000021))
+        self.assertIsNone(cache.get(PLAYER, 2))
+        self.clock.now += 101
+        self.assertIsNone(cache.get(PLAYER, 2, 1000020))
+
+    def test_lru_eviction(self):
+        cache = self.cache()
+        for page in (2, 3):
+            cache.put(PLAYER, page, HEAD, 1000020)
+            self.clock.now += 1
+        cache.max_bytes = 2 * cache.connection.execute("SELECT max(size) FROM pages").fetchone()[0]
+        # page 2 is used after page 3 was written, page 3 goes first
+        cache.get(PLAYER, 2, 1000020)
+        self.clock.now += 1
+        cache.put(PLAYER, 4, HEAD, 1000020)
+        self.assertIsNotNone(cache.get(PLAYER, 2, 1000020))
+        self.assertIsNone(cache.get(PLAYER, 3, 1000020))
+        self.assertIsNotNone(cache.get(PLAYER, 4, 1000020))
+
+    def test_reset_stats(self):
+        cache = self.cache()
+        cache.get(PLAYER, 1)
+        cache.reset_stats()
+        self.assertEqual((0, 0), (cache.hits, cache.misses))
+
+
+class IncrementalCollectionTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = PageCache(os.path.join(self.directory, 'pages.sqlite'))
+        self.server = FixtureServer({'nick': generate_lines(45)}).start()
+
+    def tearDown(self):
+        self.server.stop()
+        self.cache.close()
+        shutil.rmtree(self.directory)
+
+    def collect(self, newest: int = None) -> [str]:
+        fetcher = HttpFetcher(self.server.url, limiter=AdaptiveRateLimiter(rate=100, burst=100), cache=self.cache)
+        try:
+            return [line for page in fetcher.data_collection(self.server.url + '/id0', newest) for line in page]
+        finally:
+            fetcher.close()
+
+    def test_new_fight_within_live_ttl(self):
+        lines = self.collect()
+        self.assertEqual(45, len(lines))
+        newest = fight_id(lines[0])
+        new = lines[0].replace(f'#{newest}', f'#{newest + 1}', 1)
+        self.server.add_fights('nick', [new])
+        # the first page was cached a moment ago, the new fight is on it
+        self.assertEqual(new, self.collect(newest)[0])
+        # page 1 is not looked up, page 2 is shifted by the new fight
+        self.assertEqual((0, 1), (self.cache.hits, self.cache.misses))
+        self.assertEqual(46, len(self.collect()))
+        # page 3 was cached with the old head
+        self.assertEqual((2, 1), (self.cache.hits, self.cache.misses))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""parse_fights against the line-by-line data_preparation + create_dataframe on every line variant of synthetic.py
+
+    python -m unittest discover tests
+"""
+import os
+import random
+import sys
+import unittest
+from datetime import datetime
+
+from pandas.testing import assert_frame_equal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parsing
+from fight_lines import fight_id
+from schema import apply_schema
+from synthetic import fight_line, generate_lines, generate_text
+
+NOW = datetime(2019, 3, 1, 12, 0)
+# one line of every variant of synthetic.fight_line and generate_lines, newest first
+VARIANTS = [
+    '#1000020 7 мин назад 11:53 CS 1.6 Classic Mix 5 vs 5 de_dust2 A Победа 12/7 3.4 (x2) 120',
+    '#1000019 2 час назад 09:40 CS 1.6 Public Cup 2 vs 2 de_nuke B Поражение 3/9 -4.1 (x1)',
+    '#1000018 Сегодня 08:05 CS 1.6 Classic Duel 1 vs 1 aim_map A Ничья 10/10 0.0 35',
+    '#1000017 Сегодня 07:30 CS 1.6 Classic Mix 3 vs 3 de_inferno B Победа -/- 1.5',
+    '#1000016 Вчера 23:15 CS 1.6 Classic Mix 5 vs 5 de_train A Поражение 0/12',
+    '#1000015 Вчера 01:00 CS 1.6 Public Cup 5 vs 5 de_mirage B Не состоялся',
+    '#1000014 Позавчера 18:45 CS 1.6 Classic Mix 2 vs 2 cs_assault A Ошибка',
+    '#1000013 26 февраля 2019 20:15 CS 1.6 Classic Mix 5 vs 5 de_tuscan B Победа 25/3 9.9 (x3) 480',
+    '#1000012 1 января 2019 00:05 CS 1.6 Public Cup 1 vs 1 de_dust2 A Поражение -/-',
+    '#1000011 31 декабря 2018 23:59 CS 1.6 Classic Duel 3 vs 3 de_nuke B Ничья 5/5 -0.5 (x1) 0',
+]
+
+
+def loop_frame(text: str):
+    return apply_schema(parsing.create_dataframe(parsing.data_preparation(text, NOW)))
+
+
+class ParseFightsTest(unittest.TestCase):
+    def assert_same(self, text: str):
+        assert_frame_equal(loop_frame(text), parsing.parse_fights(text, NOW))
+
+    def test_variants(self):
+        self.assert_same("\n".join(VARIANTS))
+
+    def test_every_variant_alone(self):
+        for line in VARIANTS:
+            with self.subTest(line=line):
+                self.assert_same(line)
+
+    def test_synthetic(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                self.assert_same(generate_text(2000, seed, NOW))
+
+    def test_synthetic_tails(self):
+        # every tail of fight_line: "Не состоялся", "Ошибка", "-/-", "(xN)" with and without experience, no skill
+        rnd = random.Random(0)
+        self.assert_same("\n".join(fight_line(10 ** 6 - i, 'Сегодня 11:00', rnd) for i in range(1000)))
+
+    def test_order_played(self):
+        # several fights a day: they are sorted by day only, the fights of a day must stay in the order played
+        lines = generate_lines(5000, 1, NOW)
+        text = "\n".join(lines)
+        buffer = parsing.FightBuffer(NOW, batch_lines=300)
+        for i in range(0, len(lines), 100):
+            buffer.append(lines[i:i + 100])
+        for name, df in [('loop', loop_frame(text)), ('parse_fights', parsing.parse_fights(text, NOW)),
+                         ('FightBuffer', buffer.frame())]:
+            with self.subTest(name):
+                self.assertGreater(df.Дата.duplicated().sum(), len(df) // 2)
+                self.assertEqual([fight_id(fight) for fight in df.Игра], sorted(fight_id(line) for line in lines))
+
+    def test_empty(self):
+        self.assertEqual(len(parsing.parse_fights('', NOW)), 0)
+        self.assertEqual(list(parsing.parse_fights('', NOW).columns), list(loop_frame(VARIANTS[0]).columns))
+
+
+if __name__ == '__main__':
+    unittest.main()
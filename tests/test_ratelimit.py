@@ -0,0 +1,79 @@
+"""AdaptiveRateLimiter: token bucket, speed up on success, back off and pause on 429
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ratelimit
+from ratelimit import AdaptiveRateLimiter
+
+
+class Clock:
+    """monotonic and sleep of ratelimit: sleep moves the time on"""
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class AdaptiveRateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        for name in ('monotonic', 'sleep'):
+            patch = mock.patch.object(ratelimit, name, getattr(self.clock, name))
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_burst_then_rate(self):
+        limiter = AdaptiveRateLimiter(rate=2, burst=3)
+        for _ in range(3):
+            limiter.acquire()
+        self.assertEqual([], self.clock.slept)
+        limiter.acquire()
+        self.assertAlmostEqual(0.5, sum(self.clock.slept))
+
+    def test_success_speeds_up_to_max(self):
+        limiter = AdaptiveRateLimiter(rate=1, max_rate=2)
+        limiter.success()
+        self.assertEqual(1 + ratelimit.RATE_STEP, limiter.rate)
+        for _ in range(10):
+            limiter.success()
+        self.assertEqual(2, limiter.rate)
+
+    def test_throttle_backs_off_to_min(self):
+        limiter = AdaptiveRateLimiter(rate=4, min_rate=1)
+        limiter.throttle()
+        self.assertEqual(4 * ratelimit.BACKOFF, limiter.rate)
+        for _ in range(10):
+            limiter.throttle()
+        self.assertEqual(1, limiter.rate)
+        self.assertEqual(11, limiter.throttled)
+
+    def test_throttle_pauses_for_retry_after(self):
+        limiter = AdaptiveRateLimiter(rate=100, burst=100)
+        limiter.throttle(3)
+        start = self.clock.now
+        limiter.acquire()
+        self.assertAlmostEqual(3, self.clock.now - start)
+
+    def test_throttle_default_pause(self):
+        limiter = AdaptiveRateLimiter(rate=100, burst=100)
+        limiter.throttle()
+        start = self.clock.now
+        limiter.acquire()
+        self.assertAlmostEqual(ratelimit.DEFAULT_RETRY_AFTER, self.clock.now - start)
+
+
+if __name__ == '__main__':
+    unittest.main()
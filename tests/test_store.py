@@ -0,0 +1,90 @@
+"""FightStore.load_cube against aggregation.aggregate of FightStore.load on synthetic.py histories
+
+    python -m unittest discover tests
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from pandas.testing import assert_frame_equal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregation import DEFEAT, WIN, aggregate, rollup
+from parsing import parse_fights
+from store import FightStore
+from synthetic import generate_lines
+
+NOW = datetime(2019, 3, 1, 12, 0)
+PLAYER = 'player'
+# rollups of the charts of FCStats.visualization
+KEYS = ['Карта', 'Сторона', 'Размер', 'Результат', 'Час', 'Месяц', 'Год', 'ДеньНедели']
+
+
+class FightStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = FightStore(os.path.join(self.directory, 'fights.sqlite'))
+        lines = generate_lines(1000, 0, NOW)
+        # newest first: the last 200 fights are played after the first 800
+        self.new = parse_fights("\n".join(lines[:200]), NOW)
+        self.old = parse_fights("\n".join(lines[200:]), NOW)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def drop_rollup(self):
+        """The store as written before the rollup table"""
+        with self.store.connection:
+            self.store.connection.execute("DELETE FROM rollup")
+
+    def assert_cube(self, fights: int):
+        df = self.store.load()
+        self.assertEqual(fights, len(df))
+        cube = self.store.load_cube()
+        self.assertEqual(fights, cube.fights.sum())
+        for key in KEYS:
+            with self.subTest(key=key):
+                stats = aggregate(df, key)
+                # the bars of the charts are in the order of the keys
+                self.assertEqual(sorted(stats.index), list(stats.index))
+                assert_frame_equal(stats, rollup(cube, key), check_dtype=False)
+
+    def test_incremental_insert(self):
+        self.store.insert(PLAYER, self.old)
+        self.store.insert(PLAYER, self.new)
+        self.assert_cube(1000)
+
+    def test_insert_into_store_without_rollup(self):
+        self.store.insert(PLAYER, self.old)
+        self.drop_rollup()
+        self.store.insert(PLAYER, self.new)
+        self.assert_cube(1000)
+
+    def test_failed_insert_rolls_back(self):
+        self.store.insert(PLAYER, self.old)
+        self.drop_rollup()
+        with mock.patch.object(self.store, '_add_to_rollup', side_effect=sqlite3.OperationalError):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.store.insert(PLAYER, self.new)
+        # the new fights and the rollup rebuilt for them are rolled back together
+        self.assertEqual(0, self.store.connection.execute("SELECT count(*) FROM rollup").fetchone()[0])
+        self.assert_cube(800)
+
+    def test_rebuild_without_wins(self):
+        defeats = self.old[self.old.Результат != WIN]
+        self.assertIn(DEFEAT, set(defeats.Результат))
+        self.store.insert(PLAYER, defeats)
+        self.drop_rollup()
+        self.assert_cube(len(defeats))
+        self.assertEqual(0, self.store.load_cube().wins.sum())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+"""trends.form and longest_streaks against a fight-by-fight loop on synthetic.py histories
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import trends
+from aggregation import DEFEAT, WIN
+from fight_lines import fight_id
+from parsing import parse_fights
+from synthetic import generate_text
+
+NOW = datetime(2019, 3, 1, 12, 0)
+
+
+def form_loop(df, window: int, map_window: int) -> np.ndarray:
+    """Skill, K/D, win rate, streak and map skill after every fight, one fight at a time"""
+    skill, kills, deaths = df.Скилл.values, df.Фраги.values, df.Смерти.values
+    win, maps = df.Результат.values == WIN, df.Карта.values
+    rows, on_map, streak = [], {}, 0
+    for i in range(len(df)):
+        last = slice(max(0, i - window + 1), i + 1)
+        if i and win[i] == win[i - 1]:
+            streak += 1 if win[i] else -1
+        else:
+            streak = 1 if win[i] else -1
+        map_skill = on_map.setdefault(maps[i], [])
+        map_skill.append(skill[i])
+        rows.append((skill[last].mean(), kills[last].sum() / max(deaths[last].sum(), 1), win[last].mean(), streak,
+                     np.mean(map_skill[-map_window:])))
+    return np.array(rows)
+
+
+def streaks_loop(streak: [int]) -> [tuple]:
+    """(length, first, last fight number) of every streak"""
+    runs = []
+    for i, length in enumerate(streak):
+        if abs(length) == 1:
+            runs.append([length, i + 1, i + 1])
+        else:
+            runs[-1][0], runs[-1][2] = length, i + 1
+    return [tuple(run) for run in runs]
+
+
+def wins_defeats(fights: int, seed: int):
+    df = parse_fights(generate_text(fights, seed, NOW), NOW)
+    return df[(df.Результат == WIN) | (df.Результат == DEFEAT)]
+
+
+class FormTest(unittest.TestCase):
+    def assert_form(self, df, window: int, map_window: int):
+        result = trends.form(df, window, map_window)
+        self.assertEqual(list(range(1, len(df) + 1)), list(result.fight))
+        # the reference takes the order played from the fight ids, not from the parse
+        played = df.iloc[np.argsort([fight_id(fight) for fight in df.Игра], kind='mergesort')]
+        # running totals leave rounding errors around zero
+        np.testing.assert_allclose(form_loop(played, window, map_window), result[trends.FORM[1:]].values, atol=1e-9)
+
+    def test_synthetic(self):
+        for seed in range(3):
+            with self.subTest(seed=seed):
+                self.assert_form(wins_defeats(2000, seed), trends.ROLLING_FIGHTS, trends.MAP_FIGHTS)
+
+    def test_windows(self):
+        df = wins_defeats(500, 0)
+        for window in (1, 2, 7, len(df), len(df) + 10):
+            with self.subTest(window=window):
+                self.assert_form(df, window, window)
+
+    def test_large_history(self):
+        # the running totals of a long history stay exact
+        self.assert_form(wins_defeats(100000, 0), trends.ROLLING_FIGHTS, trends.MAP_FIGHTS)
+
+    def test_longest_streaks(self):
+        df = wins_defeats(5000, 1)
+        streak = trends.form(df).streak.values
+        runs = streaks_loop(streak)
+        # the longest first, streaks of the same length in the order played
+        expected = sorted((run for run in runs if run[0] > 0), key=lambda run: -run[0])[:trends.TOP_STREAKS] + \
+            sorted((run for run in runs if run[0] < 0), key=lambda run: run[0])[:trends.TOP_STREAKS]
+        table = trends.longest_streaks(df, streak)
+        self.assertEqual(expected, list(zip(table.length, table['first'], table['last'])))
+        dates = df.Дата.values
+        self.assertEqual([dates[run[1] - 1] for run in expected], list(table['from'].values))
+        self.assertEqual([dates[run[2] - 1] for run in expected], list(table.to.values))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""Form over time: rolling skill, K/D and win rate of the last fights, win and defeat streaks, moving average
+skill on every map. Every column is built from running totals (cumsum) over the fights in the order played,
+so the cost is linear in the history and there is no loop over the fights"""
+import numpy as np
+from pandas import DataFrame, concat, factorize
+
+from aggregation import WIN
+
+# --------------------- CONFIG ---------------------
+# fights of the rolling skill, K/D and win rate
+ROLLING_FIGHTS = 50
+# fights on the same map of its moving average
+MAP_FIGHTS = 20
+# rows of the longest streaks table, for wins and for defeats
+TOP_STREAKS = 10
+
+# --------------------------------------------------
+
+# columns of form
+FORM = ['fight', 'skill', 'kd', 'win_rate', 'streak', 'map_skill']
+
+
+def rolling_sum(values, window: int) -> np.ndarray:
+    """Sum of the last window values at every position, of all of them before the window is full"""
+    total = np.cumsum(values, dtype=np.float64)
+    total[window:] -= total[:-window].copy()
+    return total
+
+
+def streaks(win: np.ndarray) -> np.ndarray:
+    """Streak after every fight: n for the n-th win in a row, -n for the n-th defeat in a row"""
+    n = len(win)
+    position = np.arange(n)
+    change = np.ones(n, dtype=bool)
+    change[1:] = win[1:] != win[:-1]
+    # position of the first fight of the streak every fight is in
+    start = np.maximum.accumulate(np.where(change, position, 0))
+    length = position - start + 1
+    return np.where(win, length, -length)
+
+
+def grouped_rolling_mean(values: np.ndarray, groups, window: int) -> np.ndarray:
+    """Mean of the last window values of the same group at every position"""
+    codes = factorize(np.asarray(groups))[0]
+    values = DataFrame({'code': codes, 'value': values.astype(np.float64)})
+    by_group = values.groupby('code').value
+    total = by_group.cumsum()
+    # the running total of the group window values back
+    before = total.groupby(codes).shift(window).fillna(0).values
+    count = np.minimum(by_group.cumcount().values + 1, window)
+    return (total.values - before) / count
+
+
+def form(df: DataFrame, window: int = ROLLING_FIGHTS, map_window: int = MAP_FIGHTS) -> DataFrame:
+    """Form after every fight of df, wins and defeats in the order played (parsing.create_dataframe or
+    parse_fights): fight number, mean skill, K/D and win rate of the last window fights, streak (streaks)
+    and mean skill of the last map_window fights on the map of the fight"""
+    n = len(df)
+    skill = df.Скилл.values.astype(np.float64)
+    win = df.Результат.values == WIN
+    fights = np.minimum(np.arange(1, n + 1), window)
+    return DataFrame({
+        'fight': np.arange(1, n + 1),
+        'skill': rolling_sum(skill, window) / fights,
+        'kd': (rolling_sum(df.Фраги.values.astype(np.int64), window) /
+               np.maximum(rolling_sum(df.Смерти.values.astype(np.int64), window), 1)),
+        'win_rate': rolling_sum(win, window) / fights,
+        'streak': streaks(win),
+        'map_skill': grouped_rolling_mean(skill, df.Карта.values, map_window)
+    }, columns=FORM, index=df.index)
+
+
+def longest_streaks(df: DataFrame, streak: np.ndarray, top: int = TOP_STREAKS) -> DataFrame:
+    """Longest win and defeat streaks of the fights of form: length (negative for defeats), first and last
+    fight number and date, the wins first"""
+    # the last fight of every streak: the next one starts a new streak
+    last = np.ones(len(streak), dtype=bool)
+    last[:-1] = np.abs(streak[1:]) == 1
+    ends = np.flatnonzero(last)
+    starts = ends - np.abs(streak[ends]) + 1
+    dates = df.Дата.values
+    runs = DataFrame({'length': streak[ends], 'first': starts + 1, 'last': ends + 1,
+                      'from': dates[starts], 'to': dates[ends]})
+    wins = runs[runs.length > 0].sort_values('length', ascending=False, kind='mergesort').head(top)
+    defeats = runs[runs.length < 0].sort_values('length', kind='mergesort').head(top)
+    return concat([wins, defeats], ignore_index=True)